@@ -1,3 +1,7 @@
 """Gamification package for Questra"""
-from .engine import add_xp, get_stats, unlock_achievement, increment_stat, ACHIEVEMENTS
+from .engine import (add_xp, apply_progress_event, get_stats, unlock_achievement, increment_stat, claim_primary_user,
+                     ACHIEVEMENTS)
+from .writer import progress_writer
+from .achievements import reevaluate_all as reevaluate_achievements
+from .ledger import stream_ledger, SnapshotRebuilder
 from .models import UserProgress, Story, Quiz, QuizQuestion, MasterPractice, MasterQuestion, DetectiveCase, Clue, LearningSession
@@ -0,0 +1,148 @@
+"""Achievements - definitions, bit assignments and the compiled rule evaluator
+
+A user's achievements are one integer (`users.achievement_bits`): each
+achievement owns a fixed bit. Bits are stored, so never reuse or renumber
+one - a retired achievement keeps its bit reserved.
+
+Rules are (metric, threshold) pairs compiled per metric into sorted
+thresholds with cumulative masks, so evaluating a user is one bisect per
+metric. The same table compiles to a SQL expression that re-evaluates
+every user in a single set-based UPDATE (see reevaluate_all).
+"""
+from bisect import bisect_right
+from typing import Dict, List, Iterable
+from sqlalchemy import update, case, literal
+
+from .database import SessionLocal
+from .models_db import User
+from .stats_cache import stats_cache
+
+# Achievement definitions for V2
+# "rule": (metric, threshold) - unlocked once the metric reaches the threshold.
+# No rule: unlocked directly by the route that observes it (e.g. a perfect quiz).
+ACHIEVEMENTS = {
+    "first_story": {"name": "Story Seeker", "desc": "Complete your first story", "icon": "📖",
+                    "bit": 0, "rule": ("stories", 1)},
+    "storyteller": {"name": "Storyteller", "desc": "Complete 10 stories", "icon": "📚",
+                    "bit": 1, "rule": ("stories", 10)},
+    "quiz_novice": {"name": "Quiz Novice", "desc": "Pass your first quiz", "icon": "❓",
+                    "bit": 2, "rule": ("quizzes", 1)},
+    "quiz_master": {"name": "Quiz Master", "desc": "Get 100% on a quiz", "icon": "🎓",
+                    "bit": 3},
+    "master_student": {"name": "Master Student", "desc": "Complete master practice", "icon": "🏆",
+                       "bit": 4, "rule": ("masters", 1)},
+    "detective": {"name": "Detective", "desc": "Solve your first case", "icon": "🔍",
+                  "bit": 5, "rule": ("cases", 1)},
+    "sherlock": {"name": "Sherlock", "desc": "Solve 5 cases", "icon": "🕵️",
+                 "bit": 6, "rule": ("cases", 5)},
+    "streak_3": {"name": "On Fire", "desc": "3 day streak", "icon": "🔥",
+                 "bit": 7, "rule": ("streak", 3)},
+    "streak_7": {"name": "Unstoppable", "desc": "7 day streak", "icon": "⚡",
+                 "bit": 8, "rule": ("streak", 7)},
+    "level_5": {"name": "Rising Star", "desc": "Reach level 5", "icon": "⭐",
+                "bit": 9, "rule": ("level", 5)},
+    "level_10": {"name": "Champion", "desc": "Reach level 10", "icon": "👑",
+                 "bit": 10, "rule": ("level", 10)},
+}
+
+# Rule metric -> SQL expression over the users row (level as calculate_level computes it)
+METRIC_COLUMNS = {
+    "stories": User.stories_completed,
+    "quizzes": User.quizzes_passed,
+    "masters": User.masters_completed,
+    "cases": User.cases_solved,
+    "streak": User.streak_days,
+    "level": User.xp // 100 + 1,
+}
+
+ACHIEVEMENT_MASKS: Dict[str, int] = {aid: 1 << info["bit"] for aid, info in ACHIEVEMENTS.items()}
+_BY_BIT = sorted((info["bit"], aid) for aid, info in ACHIEVEMENTS.items())
+
+
+def _compile(achievements: dict) -> Dict[str, tuple]:
+    """metric -> (sorted thresholds, cumulative mask earned at each threshold)"""
+    if len({info["bit"] for info in achievements.values()}) != len(achievements):
+        raise ValueError("Achievement bits must be unique")
+    rules: Dict[str, Dict[int, int]] = {}
+    for aid, info in achievements.items():
+        if "rule" not in info:
+            continue
+        metric, threshold = info["rule"]
+        if metric not in METRIC_COLUMNS:
+            raise ValueError(f"Achievement '{aid}' has a rule on unknown metric '{metric}'")
+        by_threshold = rules.setdefault(metric, {})
+        by_threshold[threshold] = by_threshold.get(threshold, 0) | ACHIEVEMENT_MASKS[aid]
+
+    table = {}
+    for metric, by_threshold in rules.items():
+        thresholds = sorted(by_threshold)
+        cumulative, mask = [], 0
+        for threshold in thresholds:
+            mask |= by_threshold[threshold]
+            cumulative.append(mask)
+        table[metric] = (thresholds, cumulative)
+    return table
+
+
+RULES = _compile(ACHIEVEMENTS)
+
+
+def evaluate(metrics: Dict[str, int]) -> int:
+    """Mask of every rule-based achievement the metrics satisfy"""
+    earned = 0
+    for metric, (thresholds, cumulative) in RULES.items():
+        index = bisect_right(thresholds, metrics.get(metric) or 0)
+        if index:
+            earned |= cumulative[index - 1]
+    return earned
+
+
+def mask_of(achievement_ids: Iterable[str]) -> int:
+    """Mask for achievement ids (unknown ids are ignored)"""
+    mask = 0
+    for aid in achievement_ids:
+        mask |= ACHIEVEMENT_MASKS.get(aid, 0)
+    return mask
+
+
+def achievement_ids(mask: int) -> List[str]:
+    """Achievement ids set in a mask, in definition (bit) order"""
+    return [aid for bit, aid in _BY_BIT if mask >> bit & 1] if mask else []
+
+
+def earned_expression():
+    """SQL expression for the rule-based mask of a users row (mirrors evaluate)"""
+    expression = literal(0)
+    for metric, (thresholds, cumulative) in RULES.items():
+        column = METRIC_COLUMNS[metric]
+        # Highest threshold first - its cumulative mask includes the lower ones
+        expression = expression.op("|")(case(
+            *[(column >= threshold, mask) for threshold, mask in reversed(list(zip(thresholds, cumulative)))],
+            else_=0
+        ))
+    return expression
+
+
+def reevaluate_all() -> List[str]:
+    """Grant rule-based achievements every user has earned but doesn't hold yet
+
+    One UPDATE over the whole users table, evaluated inside SQLite - run
+    after adding a rule. Only rows that gain a bit are written. Returns
+    the affected user keys.
+    """
+    granted = User.achievement_bits.op("|")(earned_expression())
+    db = SessionLocal()
+    try:
+        changed = db.execute(
+            update(User)
+            .where(granted != User.achievement_bits)
+            .values(achievement_bits=granted)
+            .returning(User.user_key)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.commit()
+    finally:
+        db.close()
+    for user_key in changed:
+        stats_cache.invalidate(user_key)
+    return changed
@@ -1,10 +1,11 @@
 """Database connection handling"""
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from pathlib import Path
 
-# Create database in the data directory
-DB_FILE = Path(__file__).parent.parent / "data" / "questra.db"
+# Create database in the data directory (QUESTRA_DB_FILE overrides, e.g. for benchmarks)
+DB_FILE = Path(os.getenv("QUESTRA_DB_FILE", str(Path(__file__).parent.parent / "data" / "questra.db")))
 DB_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_FILE}"
@@ -14,6 +15,21 @@ engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 
+# NORMAL is durable across app crashes in WAL mode (only an OS crash can drop
+# the last commits) and skips the fsync on every commit that FULL does
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets every gunicorn worker read while one writes; wait on locks instead of failing"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -25,3 +41,18 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def add_missing_column(table: str, column: str, ddl: str, *statements: str) -> bool:
+    """Add a column that create_all can't add to an existing table
+    
+    `ddl` is the column definition ("content_ref VARCHAR"); `statements`
+    run afterwards in the same transaction (indexes, backfills).
+    Returns True if the column was added.
+    """
+    if column in {c["name"] for c in inspect(engine).get_columns(table)}:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+        for statement in statements:
+            conn.execute(text(statement))
+    return True
@@ -1,28 +1,65 @@
 """Gamification Engine - XP, Levels, Achievements for V2 (SQLite Version)"""
+import time
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List
+from sqlalchemy import insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from .database import SessionLocal, engine
-from .models_db import Base, User
+from .database import SessionLocal, engine, add_missing_column
+from .models_db import Base, User, LedgerEntry
 from .models import UserProgress
+from .stats_cache import stats_cache
+from .achievements import ACHIEVEMENTS, ACHIEVEMENT_MASKS, evaluate, mask_of, achievement_ids
 
 # Create tables if they don't exist
 Base.metadata.create_all(bind=engine)
 
-# Achievement definitions for V2
-ACHIEVEMENTS = {
-    "first_story": {"name": "Story Seeker", "desc": "Complete your first story", "icon": "📖"},
-    "storyteller": {"name": "Storyteller", "desc": "Complete 10 stories", "icon": "📚"},
-    "quiz_novice": {"name": "Quiz Novice", "desc": "Pass your first quiz", "icon": "❓"},
-    "quiz_master": {"name": "Quiz Master", "desc": "Get 100% on a quiz", "icon": "🎓"},
-    "master_student": {"name": "Master Student", "desc": "Complete master practice", "icon": "🏆"},
-    "detective": {"name": "Detective", "desc": "Solve your first case", "icon": "🔍"},
-    "sherlock": {"name": "Sherlock", "desc": "Solve 5 cases", "icon": "🕵️"},
-    "streak_3": {"name": "On Fire", "desc": "3 day streak", "icon": "🔥"},
-    "streak_7": {"name": "Unstoppable", "desc": "7 day streak", "icon": "⚡"},
-    "level_5": {"name": "Rising Star", "desc": "Reach level 5", "icon": "⭐"},
-    "level_10": {"name": "Champion", "desc": "Reach level 10", "icon": "👑"},
+# Key of the original site-wide user (progress from before per-user keys)
+PRIMARY_USER_KEY = "primary"
+
+# Databases from the single-user days: key the existing row as the primary user
+add_missing_column(
+    "users", "user_key", "user_key VARCHAR",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_user_key ON users (user_key)",
+    f"UPDATE users SET user_key = '{PRIMARY_USER_KEY}' WHERE id = (SELECT MIN(id) FROM users)"
+)
+
+# Progress from before the ledger goes in as one opening entry per counter
+add_missing_column(
+    "users", "ledger_seq", "ledger_seq INTEGER DEFAULT 0",
+    *[f"""INSERT INTO progress_ledger (user_key, kind, name, amount, reason, created_at)
+          SELECT user_key, '{kind}', {name}, {column}, 'Opening balance', CAST(strftime('%s', 'now') AS REAL)
+          FROM users WHERE user_key IS NOT NULL AND {column} > 0"""
+      for kind, name, column in [("xp", "NULL", "xp"),
+                                 ("stat", "'stories_completed'", "stories_completed"),
+                                 ("stat", "'quizzes_passed'", "quizzes_passed"),
+                                 ("stat", "'masters_completed'", "masters_completed"),
+                                 ("stat", "'cases_solved'", "cases_solved")]],
+    """UPDATE users SET ledger_seq = COALESCE(
+           (SELECT MAX(id) FROM progress_ledger WHERE progress_ledger.user_key = users.user_key), 0)"""
+)
+
+# Achievements held as JSON lists before the bitmask get their bits
+add_missing_column(
+    "users", "achievement_bits", "achievement_bits INTEGER DEFAULT 0",
+    f"""UPDATE users SET achievement_bits = (
+           SELECT COALESCE(SUM(CASE value {' '.join(f"WHEN '{aid}' THEN {mask}" for aid, mask in ACHIEVEMENT_MASKS.items())} ELSE 0 END), 0)
+           FROM (SELECT DISTINCT value FROM json_each(users.achievements)))
+       WHERE json_valid(achievements)"""
+)
+
+# Stat names (short or long) -> User counter column
+STAT_COLUMNS = {
+    "stories": "stories_completed",
+    "stories_completed": "stories_completed",
+    "quizzes": "quizzes_passed",
+    "quizzes_passed": "quizzes_passed",
+    "masters": "masters_completed",
+    "masters_completed": "masters_completed",
+    "cases": "cases_solved",
+    "cases_solved": "cases_solved",
 }
 
 def calculate_level(xp: int) -> int:
@@ -34,27 +71,89 @@ def xp_for_next_level(current_xp: int) -> int:
     current_level = calculate_level(current_xp)
     return (current_level * 100) - current_xp
 
-def get_db_user(db: Session) -> User:
-    """Get the primary user or create if not exists"""
-    user = db.query(User).first()
+def get_db_user(db: Session, user_key: str = PRIMARY_USER_KEY) -> User:
+    """Get a user by key (indexed lookup) or create it if it doesn't exist"""
+    user = db.query(User).filter(User.user_key == user_key).first()
     if not user:
-        user = User(username="Player", xp=0, level=1, achievements=[])
+        user = User(user_key=user_key, username="Player", xp=0, level=1, achievement_bits=0)
         db.add(user)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request created this user first
+            db.rollback()
+            return db.query(User).filter(User.user_key == user_key).one()
         db.refresh(user)
     return user
 
-def get_stats() -> Dict[str, Any]:
-    """Get current user stats"""
+def ensure_user_in(db: Session, user_key: str) -> None:
+    """Create a user row if it doesn't exist, inside the caller's transaction (no commit)"""
+    db.execute(sqlite_insert(User)
+               .values(user_key=user_key, username="Player", xp=0, level=1, achievement_bits=0)
+               .on_conflict_do_nothing(index_elements=[User.user_key]))
+
+# Counters a merge adds up (xp is handled with them)
+MERGED_COUNTERS = ("xp", "stories_completed", "quizzes_passed", "masters_completed", "cases_solved")
+
+def claim_primary_user(user_key: str) -> bool:
+    """Give the pre-cookie progress (the "primary" user and its ledger) to a visitor - True if it was unclaimed
+    
+    A visitor with no progress yet takes the primary row over; one who
+    already has some gets it merged in (counters added up, achievements
+    and the latest streak kept) and the primary row is deleted. It all
+    happens in one transaction that starts with a write, so exactly one
+    visitor ever gets it.
+    """
+    db = SessionLocal()
+    try:
+        # Writing first takes SQLite's write lock before anything is read
+        db.execute(update(LedgerEntry)
+                   .where(LedgerEntry.user_key == PRIMARY_USER_KEY)
+                   .values(user_key=user_key)
+                   .execution_options(synchronize_session=False))
+        primary = db.query(User).filter(User.user_key == PRIMARY_USER_KEY).first()
+        if primary is None:
+            db.rollback()
+            return False
+        
+        user = db.query(User).filter(User.user_key == user_key).first()
+        if user is None:
+            primary.user_key = user_key
+        else:
+            for counter in MERGED_COUNTERS:
+                setattr(user, counter, (getattr(user, counter) or 0) + (getattr(primary, counter) or 0))
+            user.level = calculate_level(user.xp)
+            user.achievement_bits = (user.achievement_bits or 0) | (primary.achievement_bits or 0)
+            # Both snapshots cover all of their own ledger entries, so the merged one covers both
+            user.ledger_seq = max(user.ledger_seq or 0, primary.ledger_seq or 0)
+            if (primary.last_active or "") > (user.last_active or ""):
+                user.last_active, user.streak_days = primary.last_active, primary.streak_days
+            db.delete(primary)
+        db.commit()
+    finally:
+        db.close()
+    stats_cache.invalidate(user_key)
+    print(f"[USERS] Primary progress claimed by {user_key[:8]}...")
+    return True
+
+def get_stats(user_key: str = PRIMARY_USER_KEY) -> Dict[str, Any]:
+    """Get a user's stats (cached until their next progress write - don't mutate)"""
+    return stats_cache.get(user_key, lambda: load_stats(user_key))
+
+def load_stats(user_key: str = PRIMARY_USER_KEY) -> Dict[str, Any]:
+    """Read a user's stats from the database (a visitor with no progress yet gets zeros)"""
     db = SessionLocal()
     try:
-        user = get_db_user(db)
+        user = db.query(User).filter(User.user_key == user_key).first()
+        if user is None:
+            user = User(user_key=user_key, xp=0, streak_days=0, achievement_bits=0, stories_completed=0,
+                        quizzes_passed=0, masters_completed=0, cases_solved=0)
         return {
             "xp": user.xp,
             "level": calculate_level(user.xp),
             "xp_next": xp_for_next_level(user.xp),
             "streak": user.streak_days,
-            "achievements": user.achievements,
+            "achievements": achievement_ids(user.achievement_bits),
             "stats": {
                 "stories": user.stories_completed,
                 "quizzes": user.quizzes_passed,
@@ -65,104 +164,164 @@ def get_stats() -> Dict[str, Any]:
     finally:
         db.close()
 
-def unlock_achievement(achievement_id: str) -> bool:
+def unlock_achievement(achievement_id: str, user_key: str = PRIMARY_USER_KEY) -> bool:
     """Unlock an achievement directly"""
-    if achievement_id not in ACHIEVEMENTS:
+    mask = ACHIEVEMENT_MASKS.get(achievement_id)
+    if mask is None:
         return False
         
     db = SessionLocal()
     try:
-        user = get_db_user(db)
-        
-        # Ensure achievements is list
-        current_achievements = list(user.achievements) if user.achievements else []
-        
-        if achievement_id not in current_achievements:
-            current_achievements.append(achievement_id)
-            user.achievements = current_achievements # Reassign to trigger update
-            db.commit()
-            return True
-        return False
+        ensure_user_in(db, user_key)
+        # Set the bit only if it's clear - one atomic UPDATE, no read-modify-write
+        unlocked = db.execute(
+            update(User)
+            .where(User.user_key == user_key, User.achievement_bits.op("&")(mask) == 0)
+            .values(achievement_bits=User.achievement_bits.op("|")(mask))
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.commit()
+        if unlocked:
+            stats_cache.invalidate(user_key)
+        return unlocked
     finally:
         db.close()
 
-def increment_stat(stat_name: str) -> None:
-    """Increment a specific stat"""
+def increment_stat(stat_name: str, user_key: str = PRIMARY_USER_KEY) -> None:
+    """Increment a specific stat (atomic SQL increment)"""
+    column = STAT_COLUMNS.get(stat_name)
+    if not column:
+        return
     db = SessionLocal()
     try:
-        user = get_db_user(db)
-        # Accept both short and long names
-        if stat_name in ["stories_completed", "stories"]:
-            user.stories_completed += 1
-        elif stat_name in ["quizzes_passed", "quizzes"]:
-            user.quizzes_passed += 1
-        elif stat_name in ["masters_completed", "masters"]:
-            user.masters_completed += 1
-        elif stat_name in ["cases_solved", "cases"]:
-            user.cases_solved += 1
+        ensure_user_in(db, user_key)
+        seq = append_ledger(db, ledger_entries(user_key, stats=[stat_name]))[-1]
+        counter = getattr(User, column)
+        db.execute(update(User)
+                   .where(User.user_key == user_key)
+                   .values({column: counter + 1, "ledger_seq": seq})
+                   .execution_options(synchronize_session=False))
         db.commit()
+        stats_cache.invalidate(user_key)
     finally:
         db.close()
 
-def add_xp(amount: int, reason: str = "") -> dict:
+def add_xp(amount: int, reason: str = "", user_key: str = PRIMARY_USER_KEY) -> dict:
     """Add XP and check for level ups and achievements"""
+    return apply_progress_event(xp=amount, reason=reason, user_key=user_key)
+
+def apply_progress_event(xp: int = 0, reason: str = "", stats: Iterable[str] = (),
+                         achievements: Iterable[str] = (), user_key: str = PRIMARY_USER_KEY) -> dict:
+    """Apply one progress event - XP, stat increments, achievements - in a single transaction
+    
+    XP and stat counters are bumped with atomic SQL increments, and that first
+    UPDATE takes SQLite's write lock, so the level/streak/achievement update
+    that follows can't interleave with another event: no lost updates, one
+    commit. `achievements` are unlocked directly (e.g. "quiz_master"); the
+    XP/stat-based ones are checked against the post-event counters.
+    The XP grant and stat increments are appended to the ledger in the same
+    transaction, so the user row (the snapshot) never disagrees with it.
+    Returns the same shape as add_xp.
+    """
     db = SessionLocal()
     try:
-        user = get_db_user(db)
-        old_level = calculate_level(user.xp)
-        
-        user.xp += amount
-        new_level = calculate_level(user.xp)
-        user.level = new_level
-        
-        # Check streak
-        today = datetime.now().strftime("%Y-%m-%d")
-        if user.last_active:
-            last = datetime.strptime(user.last_active, "%Y-%m-%d")
-            diff = (datetime.now() - last).days
-            if diff == 1:
-                user.streak_days += 1
-            elif diff > 1:
-                user.streak_days = 1
-        else:
-            user.streak_days = 1
-        user.last_active = today
-        
-        # Check achievements
-        new_achievements = []
-        current_achievements = list(user.achievements) if user.achievements else []
-        
-        # Helper to add achievement
-        def try_unlock(aid):
-            if aid not in current_achievements:
-                current_achievements.append(aid)
-                new_achievements.append(ACHIEVEMENTS[aid])
-        
-        if user.streak_days >= 3: try_unlock("streak_3")
-        if user.streak_days >= 7: try_unlock("streak_7")
-        if new_level >= 5: try_unlock("level_5")
-        if new_level >= 10: try_unlock("level_10")
-        
-        # Stat-based achievements
-        if user.stories_completed >= 1: try_unlock("first_story")
-        if user.stories_completed >= 10: try_unlock("storyteller")
-        if user.quizzes_passed >= 1: try_unlock("quiz_novice")
-        if user.cases_solved >= 1: try_unlock("detective")
-        if user.cases_solved >= 5: try_unlock("sherlock")
-        
-        user.achievements = current_achievements
+        ids = append_ledger(db, ledger_entries(user_key, xp, reason, stats))
+        result = apply_event_in(db, xp, stats, achievements, user_key, ids[-1] if ids else None)
         db.commit()
-        
-        leveled_up = new_level > old_level
-        
-        return {
-            "xp_gained": amount,
-            "total_xp": user.xp,
-            "level": new_level,
-            "leveled_up": leveled_up,
-            "xp_to_next": xp_for_next_level(user.xp),
-            "streak": user.streak_days,
-            "new_achievements": new_achievements
-        }
+        stats_cache.invalidate(user_key)
+        return result
     finally:
         db.close()
+
+def ledger_entries(user_key: str, xp: int = 0, reason: str = "", stats: Iterable[str] = ()) -> List[dict]:
+    """Ledger rows for one progress event: an XP grant and one row per stat increment"""
+    now = time.time()
+    rows = []
+    if xp:
+        rows.append({"user_key": user_key, "kind": "xp", "name": None, "amount": xp,
+                     "reason": reason, "created_at": now})
+    for stat_name in stats:
+        column = STAT_COLUMNS.get(stat_name)
+        if column:
+            rows.append({"user_key": user_key, "kind": "stat", "name": column, "amount": 1,
+                         "reason": reason, "created_at": now})
+    return rows
+
+def append_ledger(db: Session, rows: List[dict]) -> List[int]:
+    """Bulk-append ledger rows (one multi-row INSERT) - returns their ids in order"""
+    if not rows:
+        return []
+    result = db.execute(insert(LedgerEntry).returning(LedgerEntry.id, sort_by_parameter_order=True), rows)
+    return list(result.scalars())
+
+def apply_event_in(db: Session, xp: int = 0, stats: Iterable[str] = (),
+                   achievements: Iterable[str] = (), user_key: str = PRIMARY_USER_KEY,
+                   ledger_seq: int = None) -> dict:
+    """apply_progress_event's work inside the caller's transaction (never commits or rolls back)
+
+    `ledger_seq` is the id of the event's last ledger row, already appended
+    by the caller; the user row records it as its snapshot position.
+    """
+    values = {"xp": User.xp + xp}
+    if ledger_seq is not None:
+        values["ledger_seq"] = ledger_seq
+    for stat_name in stats:
+        column = STAT_COLUMNS.get(stat_name)
+        if column:
+            values[column] = values.get(column, getattr(User, column)) + 1
+    
+    bump = (update(User)
+            .where(User.user_key == user_key)
+            .values(values)
+            .returning(User.id, User.xp, User.streak_days, User.last_active, User.achievement_bits,
+                       User.stories_completed, User.quizzes_passed, User.masters_completed, User.cases_solved)
+            .execution_options(synchronize_session=False))
+    
+    user = db.execute(bump).first()
+    if user is None:
+        ensure_user_in(db, user_key)  # User's first event - create them, then apply
+        user = db.execute(bump).first()
+    
+    old_level = calculate_level(user.xp - xp)
+    new_level = calculate_level(user.xp)
+    
+    # Check streak
+    today = datetime.now().strftime("%Y-%m-%d")
+    streak_days = user.streak_days
+    if user.last_active:
+        last = datetime.strptime(user.last_active, "%Y-%m-%d")
+        diff = (datetime.now() - last).days
+        if diff == 1:
+            streak_days += 1
+        elif diff > 1:
+            streak_days = 1
+    else:
+        streak_days = 1
+    
+    # Check achievements - direct unlocks plus the compiled rules, as bitmasks
+    earned = mask_of(achievements) | evaluate({
+        "stories": user.stories_completed,
+        "quizzes": user.quizzes_passed,
+        "masters": user.masters_completed,
+        "cases": user.cases_solved,
+        "streak": streak_days,
+        "level": new_level,
+    })
+    new_bits = earned & ~(user.achievement_bits or 0)
+    new_achievements = [ACHIEVEMENTS[aid] for aid in achievement_ids(new_bits)]
+    
+    changes = {"level": new_level, "streak_days": streak_days, "last_active": today}
+    if new_bits:
+        changes["achievement_bits"] = User.achievement_bits.op("|")(new_bits)
+    db.execute(update(User).where(User.id == user.id).values(changes)
+               .execution_options(synchronize_session=False))
+    
+    return {
+        "xp_gained": xp,
+        "total_xp": user.xp,
+        "level": new_level,
+        "leveled_up": new_level > old_level,
+        "xp_to_next": xp_for_next_level(user.xp),
+        "streak": streak_days,
+        "new_achievements": new_achievements
+    }
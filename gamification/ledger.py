@@ -0,0 +1,130 @@
+"""Progress Ledger - history queries and snapshot rebuilds over the append-only ledger
+
+Every XP grant and stat increment is appended to `progress_ledger` in the
+same transaction that updates the user row, so the row is a materialized
+snapshot of the ledger up to `users.ledger_seq`. Hot reads use the row;
+/api/progress/history streams the ledger; the StoreSweeper folds entries a
+row lags behind (e.g. after restoring an old users table) back into it.
+"""
+from typing import Dict, Iterator, Optional
+from sqlalchemy import select, update, func
+
+from .database import SessionLocal
+from .models_db import User, LedgerEntry
+from .engine import calculate_level
+from .stats_cache import stats_cache
+
+COUNTERS = ("xp", "stories_completed", "quizzes_passed", "masters_completed", "cases_solved")
+
+
+def stream_ledger(user_key: Optional[str] = None, after_id: int = 0, chunk: int = 1000) -> Iterator[dict]:
+    """Yield ledger entries in id order, a chunk per query (keyset pagination, constant memory)"""
+    while True:
+        query = select(LedgerEntry).where(LedgerEntry.id > after_id).order_by(LedgerEntry.id).limit(chunk)
+        if user_key is not None:
+            query = query.where(LedgerEntry.user_key == user_key)
+        db = SessionLocal()
+        try:
+            entries = db.execute(query).scalars().all()
+        finally:
+            db.close()
+        if not entries:
+            return
+        for entry in entries:
+            yield {
+                "id": entry.id,
+                "user_key": entry.user_key,
+                "kind": entry.kind,
+                "name": entry.name,
+                "amount": entry.amount,
+                "reason": entry.reason,
+                "created_at": entry.created_at,
+            }
+        after_id = entries[-1].id
+
+
+def _totals(db, user_key: str, after_id: int) -> tuple[Dict[str, int], int]:
+    """Counter deltas from a user's ledger entries after `after_id`, plus the last id seen"""
+    column = func.coalesce(LedgerEntry.name, LedgerEntry.kind)
+    rows = db.execute(
+        select(column, func.sum(LedgerEntry.amount), func.max(LedgerEntry.id))
+        .where(LedgerEntry.user_key == user_key, LedgerEntry.id > after_id)
+        .group_by(column)
+    ).all()
+    totals = {counter: 0 for counter in COUNTERS}
+    last_id = after_id
+    for counter, amount, max_id in rows:
+        if counter in totals:
+            totals[counter] += amount
+        last_id = max(last_id, max_id)
+    return totals, last_id
+
+
+def verify_snapshot(user_key: str) -> Dict[str, tuple]:
+    """Counters where the user row and a full replay disagree - {} if consistent"""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.user_key == user_key).first()
+        if user is None:
+            return {}
+        totals, _ = _totals(db, user_key, 0)
+        return {counter: (getattr(user, counter), totals[counter])
+                for counter in COUNTERS if getattr(user, counter) != totals[counter]}
+    finally:
+        db.close()
+
+
+def rebuild_snapshot(user_key: str, full: bool = False) -> bool:
+    """Fold ledger entries the user row hasn't seen yet into it
+
+    Incremental by default: only entries after `ledger_seq` are summed and
+    added. `full=True` recomputes the row from the whole ledger (e.g. after
+    restoring an old users table). Returns True if the row changed.
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.user_key == user_key).first()
+        if user is None:
+            return False
+        after_id = 0 if full else (user.ledger_seq or 0)
+        totals, last_id = _totals(db, user_key, after_id)
+        if full:
+            values = dict(totals)
+        else:
+            if last_id == after_id:
+                return False
+            values = {counter: getattr(User, counter) + amount for counter, amount in totals.items() if amount}
+        values["ledger_seq"] = last_id
+        db.execute(update(User).where(User.id == user.id).values(values))
+        xp = db.execute(select(User.xp).where(User.id == user.id)).scalar()
+        db.execute(update(User).where(User.id == user.id).values(level=calculate_level(xp)))
+        db.commit()
+    finally:
+        db.close()
+    stats_cache.invalidate(user_key)
+    return True
+
+
+def rebuild_snapshots() -> int:
+    """Incrementally rebuild every user row that lags the ledger - returns how many changed"""
+    db = SessionLocal()
+    try:
+        lagging = db.execute(
+            select(User.user_key)
+            .join(LedgerEntry, LedgerEntry.user_key == User.user_key)
+            .where(LedgerEntry.id > func.coalesce(User.ledger_seq, 0))
+            .distinct()
+        ).scalars().all()
+    finally:
+        db.close()
+    return sum(1 for user_key in lagging if rebuild_snapshot(user_key))
+
+
+class SnapshotRebuilder:
+    """StoreSweeper hook: fold ledger entries the user rows lag behind into them"""
+
+    def sweep(self) -> int:
+        rebuilt = rebuild_snapshots()
+        if rebuilt:
+            print(f"[LEDGER] Rebuilt {rebuilt} user snapshots from the ledger")
+        return rebuilt
@@ -1,5 +1,5 @@
 """Data models for Questra - Interactive Learning Platform"""
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -82,14 +82,20 @@ class DetectiveCase(BaseModel):
 # ==================== Learning Session ====================
 
 class LearningSession(BaseModel):
-    """Complete learning session state"""
+    """Complete learning session state
+    
+    The phase content is shared and immutable: it is identified by
+    `content_ref` and left out of serialized sessions, which only carry
+    the per-user state. Session stores re-attach it on load.
+    """
     session_id: str
     topic: str
     current_mode: str  # story, quiz, master, detective
-    story: Optional[Story] = None
-    quiz: Optional[Quiz] = None
-    master: Optional[MasterPractice] = None
-    detective: Optional[DetectiveCase] = None
+    content_ref: Optional[str] = None  # "quest:<id>:<level>" or "sha256:<hex>"
+    story: Optional[Story] = Field(default=None, exclude=True)
+    quiz: Optional[Quiz] = Field(default=None, exclude=True)
+    master: Optional[MasterPractice] = Field(default=None, exclude=True)
+    detective: Optional[DetectiveCase] = Field(default=None, exclude=True)
     story_completed: bool = False
     quiz_completed: bool = False
     master_completed: bool = False
@@ -1,23 +1,41 @@
 """SQLAlchemy Database Models"""
-from sqlalchemy import Column, Integer, String, Text, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Text, Boolean, JSON, Float, LargeBinary, Index
 from .database import Base
 
 class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
+    user_key = Column(String, unique=True, index=True)  # Visitor token from the questra_user cookie
     username = Column(String, default="Player")
     xp = Column(Integer, default=0)
     level = Column(Integer, default=1)
     streak_days = Column(Integer, default=0)
     last_active = Column(String, nullable=True)  # Stored as YYYY-MM-DD
-    achievements = Column(JSON, default=list)    # Stored as JSON list of strings
+    achievements = Column(JSON, default=list)    # Legacy JSON list of ids - migrated into achievement_bits
+    achievement_bits = Column(Integer, default=0)  # One bit per achievement (see achievements.py)
     
     # Stats
     stories_completed = Column(Integer, default=0)
     quizzes_passed = Column(Integer, default=0)
     masters_completed = Column(Integer, default=0)
     cases_solved = Column(Integer, default=0)
+    
+    # The row is a snapshot of the ledger up to this entry id
+    ledger_seq = Column(Integer, default=0)
+
+class LedgerEntry(Base):
+    """Append-only history of XP grants and stat increments"""
+    __tablename__ = "progress_ledger"
+    __table_args__ = (Index("ix_progress_ledger_user_seq", "user_key", "id"),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_key = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # "xp" or "stat"
+    name = Column(String, nullable=True)   # Stat column for "stat" entries
+    amount = Column(Integer, nullable=False)
+    reason = Column(String, default="")
+    created_at = Column(Float, index=True)
 
 class QuestSession(Base):
     """Store active or completed sessions"""
@@ -29,3 +47,49 @@ class QuestSession(Base):
     created_at = Column(String)  # Timestamp
     completed = Column(Boolean, default=False)
     xp_earned = Column(Integer, default=0)
+
+class CachedContent(Base):
+    """Parsed AI-generated content, keyed by normalized topic"""
+    __tablename__ = "content_cache"
+    
+    topic_key = Column(String, primary_key=True)
+    topic = Column(String)
+    payload = Column(Text)  # JSON of story/quiz/master/detective
+    created_at = Column(Float)
+    expires_at = Column(Float, index=True)
+    last_used_at = Column(Float, index=True)
+
+class StoredSession(Base):
+    """Serialized LearningSession, shared by every worker process"""
+    __tablename__ = "learning_sessions"
+    
+    session_id = Column(String, primary_key=True)
+    payload = Column(LargeBinary)  # LearningSession state as pydantic-core JSON bytes
+    content_ref = Column(String, index=True)  # ContentBlob (or pre-built quest) it plays
+    updated_at = Column(Float, index=True)
+
+class ContentBlob(Base):
+    """Immutable phase content shared by sessions, keyed by its hash"""
+    __tablename__ = "content_blobs"
+    
+    content_ref = Column(String, primary_key=True)  # "sha256:<hex>"
+    payload = Column(Text)  # JSON of story/quiz/master/detective
+    last_used_at = Column(Float, index=True)
+
+class TopicTrend(Base):
+    """Custom-topic requests per minute, counted by every worker for the pre-generator"""
+    __tablename__ = "topic_trends"
+    
+    topic_key = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True, index=True)  # Unix minute
+    topic = Column(String)  # Latest raw topic requested in the bucket
+    requests = Column(Integer, default=0)
+
+class PregenLease(Base):
+    """A background generation claimed by one worker - kept until it expires, so workers share one budget"""
+    __tablename__ = "pregen_leases"
+    
+    topic_key = Column(String, primary_key=True)
+    claimed_at = Column(Float, index=True)
+    expires_at = Column(Float, index=True)
+    running = Column(Boolean, default=True)
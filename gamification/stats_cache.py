@@ -0,0 +1,119 @@
+"""Stats Cache - per-user get_stats results, invalidated by writes in any worker"""
+import os
+import mmap
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows - single-process dev server, no cross-worker lock needed
+    fcntl = None
+
+from .database import DB_FILE
+
+_SLOT = struct.Struct("<Q")
+
+
+class VersionCounter:
+    """Array of uint64 version slots in a shared memory-mapped file
+
+    Every worker maps the same file, so a bump in one worker is visible to
+    the others on their next read - a plain memory read, no syscall. Keys
+    hash into `slots` slots; two keys sharing a slot only cost an extra
+    reload. Bumps take an flock so concurrent increments aren't lost.
+    """
+
+    def __init__(self, path: Path, slots: int = 4096):
+        self.path = Path(path)
+        self.slots = slots
+        size = slots * _SLOT.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def slot(self, key: str) -> int:
+        return (zlib.crc32(key.encode()) % self.slots) * _SLOT.size
+
+    def read(self, key: str) -> int:
+        return _SLOT.unpack_from(self._map, self.slot(key))[0]
+
+    def bump(self, key: str) -> int:
+        offset = self.slot(key)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            version = _SLOT.unpack_from(self._map, offset)[0] + 1
+            _SLOT.pack_into(self._map, offset, version)
+            return version
+        finally:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class StatsCache:
+    """get_stats results per user, valid while the user's version is unchanged
+
+    Reads compare the cached version with the shared counter and only hit
+    SQLite after a write. Writers call invalidate() after committing. The
+    version is read before loading, so a write that lands mid-load leaves
+    the entry stale and the next read reloads it. Cached dicts are shared:
+    callers must not mutate them. At most `max_entries` users are kept
+    (least recently used go first).
+    """
+
+    def __init__(self, versions: VersionCounter, max_entries: int = 10000):
+        self.versions = versions
+        self.max_entries = max_entries
+        self._entries: Dict[str, tuple] = OrderedDict()  # user_key -> (version, stats)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_key: str, load: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        version = self.versions.read(user_key)
+        with self._lock:
+            entry = self._entries.get(user_key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_key)
+                self.hits += 1
+                return entry[1]
+
+        stats = load()
+        with self._lock:
+            self.misses += 1
+            self._entries[user_key] = (version, stats)
+            self._entries.move_to_end(user_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return stats
+
+    def invalidate(self, user_key: str) -> None:
+        self.versions.bump(user_key)
+        with self._lock:
+            self._entries.pop(user_key, None)
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+
+stats_cache = StatsCache(
+    VersionCounter(
+        Path(os.getenv("STATS_VERSION_FILE", str(DB_FILE.parent / "stats.version"))),
+        slots=int(os.getenv("STATS_VERSION_SLOTS", "4096")),
+    ),
+    max_entries=int(os.getenv("STATS_CACHE_MAX_ENTRIES", "10000")),
+)
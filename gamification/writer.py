@@ -0,0 +1,193 @@
+"""Progress Writer - group-commits queued gamification events on a dedicated thread"""
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Iterable
+
+from .database import SessionLocal
+from .engine import apply_event_in, append_ledger, ledger_entries, PRIMARY_USER_KEY
+from .stats_cache import stats_cache
+
+_STOP = object()
+_FLUSH = object()
+
+
+class ProgressWriter:
+    """Single writer thread that batches progress events into group commits
+
+    Callers enqueue events and get a Future for the add_xp-shaped result.
+    The writer takes the first queued event, gathers whatever else arrives
+    within `batch_window` seconds (up to `max_batch`), appends the batch's
+    ledger rows in one bulk insert, applies the events and commits once -
+    one fsync and one write lock for the whole batch instead of one per
+    event. If a batch fails, its events
+    are retried one transaction each so a bad event only fails itself.
+
+    The Future resolves after the commit, so awaiting it (or flush()) gives
+    read-your-writes, from this worker or any other. An event whose caller
+    gave up (a cancelled request) is still committed - only its result is
+    dropped.
+    """
+
+    def __init__(self, batch_window: float = 0.005, max_batch: int = 256):
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.events = 0
+        self.batches = 0
+        self.failed = 0
+        self.largest_batch = 0
+
+    def submit(self, xp: int = 0, reason: str = "", stats: Iterable[str] = (),
+               achievements: Iterable[str] = (), user_key: str = PRIMARY_USER_KEY) -> Future:
+        """Queue a progress event (see engine.apply_progress_event)"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put(((xp, reason, tuple(stats), tuple(achievements), user_key), future))
+        return future
+
+    async def apply(self, xp: int = 0, reason: str = "", stats: Iterable[str] = (),
+                    achievements: Iterable[str] = (), user_key: str = PRIMARY_USER_KEY) -> dict:
+        """Queue an event and wait for its commit without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(xp, reason, stats, achievements, user_key))
+
+    def flush(self, timeout: float = None) -> None:
+        """Block until everything queued so far is committed"""
+        self._barrier().result(timeout)
+
+    async def flush_async(self) -> None:
+        await asyncio.wrap_future(self._barrier())
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Commit what's queued, then stop the thread"""
+        if self._thread:
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "events": self.events,
+            "batches": self.batches,
+            "avg_batch": round(self.events / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+        }
+
+    def _barrier(self) -> Future:
+        # Resolves once the batch it lands in (and everything before it) is committed
+        self._ensure_started()
+        future = Future()
+        self._queue.put((_FLUSH, future))
+        return future
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            stopping = first[0] is _STOP
+            deadline = time.monotonic() + self.batch_window
+            while not stopping and len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                stopping = item[0] is _STOP
+                batch.append(item)
+
+            # Futures can't be cancelled once running; a cancelled one's result goes nowhere
+            batch = [(item, future if future is not None and future.set_running_or_notify_cancel() else None)
+                     for item, future in batch]
+            events = [item for item in batch if item[0] is not _STOP and item[0] is not _FLUSH]
+            try:
+                if events:
+                    self._commit(events)
+            except Exception as e:
+                # Never let the thread die - every later apply() would wait forever
+                print(f"[WRITER] Batch of {len(events)} crashed: {type(e).__name__}: {e}")
+                for _, future in events:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+            for marker, future in batch:
+                if marker is _FLUSH and future is not None:
+                    future.set_result(None)
+            if stopping:
+                return
+
+    def _commit(self, events: list) -> None:
+        db = SessionLocal()
+        try:
+            rows = [ledger_entries(user_key, xp, reason, stats) for (xp, reason, stats, _, user_key), _ in events]
+            ids = iter(append_ledger(db, [row for event_rows in rows for row in event_rows]))
+            results = []
+            for ((xp, _, stats, achievements, user_key), _), event_rows in zip(events, rows):
+                seq = None
+                for _ in event_rows:
+                    seq = next(ids)
+                results.append(apply_event_in(db, xp, stats, achievements, user_key, seq))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[WRITER] Batch of {len(events)} failed, retrying one by one: {type(e).__name__}: {e}")
+            results = None
+        finally:
+            db.close()
+
+        if results is None:
+            self._commit_each(events)
+        else:
+            # Committed - nothing from here on may send the batch to _commit_each again
+            self._invalidate({event[-1] for event, _ in events})
+            for (_, future), result in zip(events, results):
+                if future is not None:
+                    future.set_result(result)
+        self.events += len(events)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(events))
+
+    def _commit_each(self, events: list) -> None:
+        for event, future in events:
+            db = SessionLocal()
+            try:
+                xp, reason, stats, achievements, user_key = event
+                ids = append_ledger(db, ledger_entries(user_key, xp, reason, stats))
+                result = apply_event_in(db, xp, stats, achievements, user_key, ids[-1] if ids else None)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self.failed += 1
+                if future is not None:
+                    future.set_exception(e)
+                continue
+            finally:
+                db.close()
+            self._invalidate({user_key})
+            if future is not None:
+                future.set_result(result)
+
+    def _invalidate(self, user_keys: set) -> None:
+        for user_key in user_keys:
+            try:
+                stats_cache.invalidate(user_key)
+            except Exception as e:
+                print(f"[WRITER] Stats cache invalidation failed for {user_key}: {type(e).__name__}: {e}")
+
+
+progress_writer = ProgressWriter(
+    batch_window=float(os.getenv("PROGRESS_BATCH_WINDOW_MS", "5")) / 1000,
+    max_batch=int(os.getenv("PROGRESS_MAX_BATCH", "256")),
+)
@@ -1,13 +1,18 @@
 """Questra - Interactive Learning Platform"""
 import os
+import re
+import json
+import asyncio
 import uuid
+import hmac
 import time
+from itertools import islice
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
@@ -16,12 +21,19 @@ from typing import List, Optional
 load_dotenv()
 
 # Import our modules
-from gamification import add_xp, get_stats, increment_stat, unlock_achievement
-from modules.unified_generator import generate_all_content
-from modules.prebuilt_quests import get_all_quest_info
+from gamification import (get_stats, progress_writer, reevaluate_achievements, claim_primary_user, stream_ledger,
+                          SnapshotRebuilder)
+from modules.unified_generator import (generate_all_content_async, stream_all_content, model_router, pregenerator,
+                                       level_prefetcher, prefetch_next_level)
+from modules.prebuilt_quests import get_all_quest_info, quest_packs
 from modules.quiz_mode import score_quiz
 from modules.master_mode import score_master
 from modules.detective_mode import solve_case
+from modules.content_cache import content_cache
+from modules.session_store import create_session_store, BoundedStore, StoreSweeper
+from modules.content_store import content_store
+from modules.topic_index import topic_index
+from modules.phase_payloads import PHASE_PAYLOADS, payload_cache, phase_response
 from gamification.models import LearningSession
 
 # Initialize FastAPI
@@ -47,8 +59,9 @@ templates_path.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory=static_path), name="static")
 templates = Jinja2Templates(directory=templates_path)
 
-# In-memory storage for active sessions
-active_sessions = {}
+# Active sessions - shared across workers (SESSION_STORE=sqlite) or per-process (memory).
+# Store calls can wait on SQLite's write lock, so routes make them with asyncio.to_thread.
+active_sessions = create_session_store()
 
 # ==================== Request Models ====================
 
@@ -56,6 +69,9 @@ class TopicRequest(BaseModel):
     topic: str
     api_key: Optional[str] = None
 
+class ClaimRequest(BaseModel):
+    token: str
+
 class QuizAnswers(BaseModel):
     answers: List[int]
 
@@ -74,24 +90,115 @@ class Level1Completion(BaseModel):
     correct_count: int = 0
     total_questions: int = 0
 
-# In-memory storage for level completion data (for future certificate generation)
-level_completions = {}
+# Level completion data (for future certificate generation) - bounded, in-memory
+level_completions = BoundedStore(
+    max_entries=int(os.getenv("LEVEL_COMPLETIONS_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("LEVEL_COMPLETIONS_TTL", str(7 * 24 * 3600)))
+)
+
+# Frees idle sessions and completions so long-running workers stay flat
+# (and re-reads topics other workers cached into the similarity index, and
+# drops pre-generation trend counts and leases that have run out, and folds
+# ledger entries a user row lags behind back into it)
+store_sweeper = StoreSweeper(
+    [active_sessions, level_completions, content_store, topic_index, pregenerator, SnapshotRebuilder()],
+    interval=float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+)
+
+# ==================== Visitors ====================
+
+# Each browser gets its own progress, keyed by a random token in this cookie
+USER_COOKIE = "questra_user"
+USER_COOKIE_MAX_AGE = 365 * 24 * 3600
+USER_KEY_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+@app.middleware("http")
+async def assign_user_key(request: Request, call_next):
+    """Read the visitor's progress key from the cookie, issuing one if missing"""
+    user_key = request.cookies.get(USER_COOKIE)
+    issued = not (user_key and USER_KEY_PATTERN.fullmatch(user_key))
+    if issued:
+        user_key = uuid.uuid4().hex
+    request.state.user_key = user_key
+    
+    response = await call_next(request)
+    if issued:
+        response.set_cookie(USER_COOKIE, user_key, max_age=USER_COOKIE_MAX_AGE, httponly=True, samesite="lax")
+    return response
+
+# Progress from the single-user days is keyed "primary", which no cookie can
+# hold. Its owner moves it onto their cookie once, with the token from
+# PRIMARY_CLAIM_TOKEN (the claim is disabled without one); until then new
+# visitors start from zero:
+#   curl -X POST -b "questra_user=<cookie>" -H "Content-Type: application/json" \
+#        -d '{"token": "<PRIMARY_CLAIM_TOKEN>"}' https://<host>/api/claim-progress
+PRIMARY_CLAIM_TOKEN = os.getenv("PRIMARY_CLAIM_TOKEN")
+
+@app.post("/api/claim-progress")
+async def claim_progress(request: Request, claim: ClaimRequest):
+    """Move the pre-cookie progress onto this visitor's key (once, for one visitor)"""
+    if not PRIMARY_CLAIM_TOKEN:
+        return JSONResponse({"error": "Progress claiming is disabled"}, status_code=404)
+    if not hmac.compare_digest(claim.token.encode(), PRIMARY_CLAIM_TOKEN.encode()):
+        return JSONResponse({"error": "Invalid claim token"}, status_code=403)
+    if not await asyncio.to_thread(claim_primary_user, request.state.user_key):
+        return JSONResponse({"error": "No unclaimed progress"}, status_code=404)
+    return {"claimed": True, "stats": await asyncio.to_thread(get_stats, request.state.user_key)}
+
+# ==================== Background Workers ====================
+
+@app.on_event("startup")
+async def start_background_workers():
+    """Sweep idle sessions; pre-generate trending custom topics (needs the server API key)"""
+    store_sweeper.start()
+    # Grant newly added rule-based achievements to everyone who already qualifies
+    granted = await asyncio.to_thread(reevaluate_achievements)
+    if granted:
+        print(f"[ACHIEVEMENTS] Granted new achievements to {len(granted)} users")
+    # Load the active quest pack and build the similar-topic index now rather than in the first request
+    await asyncio.to_thread(topic_index.refresh)
+    if os.getenv("OPENROUTER_API_KEY") and os.getenv("PREGEN_ENABLED", "1") == "1":
+        pregenerator.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await store_sweeper.stop()
+    await pregenerator.stop()
+    await level_prefetcher.stop()
+    await asyncio.to_thread(progress_writer.stop)
+
+# ==================== Server-Sent Events ====================
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 # ==================== Routes ====================
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Render the main dashboard"""
-    stats = get_stats()
+    stats = get_stats(request.state.user_key)
     return templates.TemplateResponse("index.html", {
         "request": request,
         "stats": stats
     })
 
 @app.get("/api/stats")
-async def api_stats():
+async def api_stats(request: Request):
     """Get user gamification stats"""
-    return get_stats()
+    return get_stats(request.state.user_key)
+
+# Ledger entries come back oldest first; pass the last id as `after_id` for the next page
+PROGRESS_HISTORY_MAX = 500
+
+@app.get("/api/progress/history")
+async def progress_history(request: Request, after_id: int = 0, limit: int = 100):
+    """Get this visitor's XP grants and stat increments from the progress ledger"""
+    limit = max(1, min(limit, PROGRESS_HISTORY_MAX))
+    entries = await asyncio.to_thread(
+        lambda: list(islice(stream_ledger(request.state.user_key, after_id, chunk=limit), limit)))
+    return {"entries": entries, "next_after_id": entries[-1]["id"] if len(entries) == limit else None}
 
 @app.get("/api/featured-quests")
 async def get_featured_quests():
@@ -99,6 +206,28 @@ async def get_featured_quests():
     quests = get_all_quest_info()
     return {"quests": quests}
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Get generated-content cache hit/miss counters"""
+    return {**content_cache.stats(), "pregeneration": pregenerator.stats(), "phase_payloads": payload_cache.stats(),
+            "similar_topics": topic_index.stats(), "quest_packs": quest_packs.stats(),
+            "level_prefetch": level_prefetcher.stats()}
+
+@app.get("/api/sessions/stats")
+async def session_stats():
+    """Get session/completion store sizes and eviction counters"""
+    return {
+        "sessions": await asyncio.to_thread(active_sessions.stats),
+        "level_completions": level_completions.stats(),
+        "content": content_store.stats(),
+        "sweeper": store_sweeper.stats()
+    }
+
+@app.get("/api/router")
+async def router_state():
+    """Get per-model health, circuit breaker state and current ordering"""
+    return model_router.snapshot()
+
 # ==================== AI Agent Adventures - Level 1 ====================
 
 @app.get("/level/ai-agents/1/intro", response_class=HTMLResponse)
@@ -128,7 +257,7 @@ async def ai_agents_level1(request: Request):
 @app.get("/level/ai-agents/1/trial", response_class=HTMLResponse)
 async def ai_agents_level1_trial(request: Request):
     """Render AI Agent Adventures Level 1: Case 001"""
-    stats = get_stats()
+    stats = get_stats(request.state.user_key)
     response = templates.TemplateResponse("level1.html", {
         "request": request,
         "stats": stats,
@@ -140,18 +269,21 @@ async def ai_agents_level1_trial(request: Request):
     return response
 
 @app.post("/api/level1/complete")
-async def complete_level1(data: Level1Completion):
+async def complete_level1(data: Level1Completion, request: Request):
     """Record Level 1 completion data for future certificate generation"""
     completion_id = str(uuid.uuid4())[:8]
     
     # Add XP to gamification engine
     if data.xp_earned > 0:
-        add_xp(data.xp_earned, "AI Agent Adventures Level 1 completed")
-        increment_stat("stories")
-        increment_stat("quizzes")
+        await progress_writer.apply(
+            xp=data.xp_earned,
+            reason="AI Agent Adventures Level 1 completed",
+            stats=["stories", "quizzes"],
+            user_key=request.state.user_key
+        )
     
     # Store completion data
-    level_completions[completion_id] = {
+    level_completions.put(completion_id, {
         "id": completion_id,
         "level": 1,
         "topic": "AI Agent Adventures",
@@ -163,7 +295,7 @@ async def complete_level1(data: Level1Completion):
         "correct_count": data.correct_count,
         "total_questions": data.total_questions,
         "completed_at": int(time.time())
-    }
+    })
     
     return {
         "success": True,
@@ -179,8 +311,8 @@ async def start_session(data: TopicRequest):
     """Start a new learning session - generates ALL content at once"""
     session_id = str(uuid.uuid4())[:8]
     
-    # Generate ALL content in one API call
-    content = generate_all_content(data.topic, user_api_key=data.api_key)
+    # Generate ALL content in one API call (awaited - keeps the event loop free)
+    content = await generate_all_content_async(data.topic, user_api_key=data.api_key)
     
     # Check if generation failed
     if content.get("error"):
@@ -193,147 +325,156 @@ async def start_session(data: TopicRequest):
         session_id=session_id,
         topic=data.topic,
         current_mode="story",
+        content_ref=await asyncio.to_thread(content_store.put, content),
         story=content["story"],
         quiz=content["quiz"],
         master=content["master"],
         detective=content["detective"]
     )
     
-    active_sessions[session_id] = session
+    await asyncio.to_thread(active_sessions.put, session)
     
-    return {
+    return phase_response({
         "session_id": session_id,
         "topic": data.topic,
         "ai_generated": content.get("success", False),
-        "source": content.get("source", "unknown"),
-        "story": {
-            "title": content["story"].title,
-            "content": content["story"].content,
-            "xp_reward": content["story"].xp_reward
-        }
-    }
+        "source": content.get("source", "unknown")
+    }, "story", session.story, session.content_ref)
+
+@app.post("/api/session/start/stream")
+async def start_session_stream(data: TopicRequest):
+    """Start a session, streaming each phase as Server-Sent Events as soon as it is generated
+    
+    Events: session -> story / quiz / master / detective (any order) -> done | error.
+    The session only accepts phase submissions after the "done" event.
+    """
+    session_id = str(uuid.uuid4())[:8]
+    
+    async def events():
+        yield sse_event("session", {"session_id": session_id, "topic": data.topic})
+        
+        async for section, value in stream_all_content(data.topic, user_api_key=data.api_key):
+            if section == "error":
+                yield sse_event("error", {"error": True, "message": value})
+                return
+            
+            if section == "done":
+                await asyncio.to_thread(active_sessions.put, LearningSession(
+                    session_id=session_id,
+                    topic=data.topic,
+                    current_mode="story",
+                    content_ref=await asyncio.to_thread(content_store.put, value),
+                    story=value["story"],
+                    quiz=value["quiz"],
+                    master=value["master"],
+                    detective=value["detective"]
+                ))
+                yield sse_event("done", {
+                    "session_id": session_id,
+                    "topic": data.topic,
+                    "ai_generated": value.get("success", False),
+                    "source": value.get("source", "unknown")
+                })
+                return
+            
+            yield sse_event(section, PHASE_PAYLOADS[section](value))
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.post("/api/session/{session_id}/complete-story")
-async def complete_story(session_id: str):
+async def complete_story(session_id: str, request: Request):
     """Mark story as complete and return quiz (already generated)"""
-    if session_id not in active_sessions:
+    session = await asyncio.to_thread(active_sessions.get, session_id)
+    if session is None:
         return JSONResponse({"error": "Session not found"}, status_code=404)
     
-    session = active_sessions[session_id]
-    
-    if not session.story_completed:
-        session.story_completed = True
-        add_xp(session.story.xp_reward, "Story completed")
-        increment_stat("stories")
-        session.total_xp_earned += session.story.xp_reward
-    
-    session.current_mode = "quiz"
+    # Claimed in the store first, so duplicate submissions award the XP once
+    if await asyncio.to_thread(active_sessions.claim_phase, session, "story", session.story.xp_reward, "quiz"):
+        await progress_writer.apply(
+            xp=session.story.xp_reward,
+            reason="Story completed",
+            stats=["stories"],
+            user_key=request.state.user_key
+        )
     
     # Quiz was already generated with the session
-    return {
+    return phase_response({
         "story_complete": True,
-        "xp_earned": session.story.xp_reward,
-        "quiz": {
-            "questions": [
-                {"question": q.question, "options": q.options}
-                for q in session.quiz.questions
-            ],
-            "total_xp": session.quiz.total_xp
-        }
-    }
+        "xp_earned": session.story.xp_reward
+    }, "quiz", session.quiz, session.content_ref)
 
 @app.post("/api/session/{session_id}/submit-quiz")
-async def submit_quiz(session_id: str, data: QuizAnswers):
+async def submit_quiz(session_id: str, data: QuizAnswers, request: Request):
     """Submit quiz answers and return master practice (already generated)"""
-    if session_id not in active_sessions:
+    session = await asyncio.to_thread(active_sessions.get, session_id)
+    if session is None:
         return JSONResponse({"error": "Session not found"}, status_code=404)
     
-    session = active_sessions[session_id]
-    
     if not session.quiz:
         return JSONResponse({"error": "Quiz not available"}, status_code=400)
     
     result = score_quiz(session.quiz, data.answers)
     
-    if not session.quiz_completed:
-        session.quiz_completed = True
-        add_xp(result["xp_earned"], "Quiz completed")
-        increment_stat("quizzes")
-        session.total_xp_earned += result["xp_earned"]
-        
-        if result["percentage"] == 100:
-            unlock_achievement("quiz_master")
-    
-    session.current_mode = "master"
+    if await asyncio.to_thread(active_sessions.claim_phase, session, "quiz", result["xp_earned"], "master"):
+        await progress_writer.apply(
+            xp=result["xp_earned"],
+            reason="Quiz completed",
+            stats=["quizzes"],
+            achievements=["quiz_master"] if result["percentage"] == 100 else [],
+            user_key=request.state.user_key
+        )
+        # Two phases to go - about as long as generating the next level takes
+        prefetch_next_level(session.topic, session.story.key_facts)
     
     # Master was already generated with the session
-    return {
-        **result,
-        "next_mode": "master",
-        "master": {
-            "questions": [
-                {"question": q.question, "options": q.options}
-                for q in session.master.questions
-            ],
-            "total_xp": session.master.total_xp
-        }
-    }
+    return phase_response({**result, "next_mode": "master"}, "master", session.master, session.content_ref)
 
 @app.post("/api/session/{session_id}/submit-master")
-async def submit_master(session_id: str, data: MasterAnswers):
+async def submit_master(session_id: str, data: MasterAnswers, request: Request):
     """Submit master practice answers and return detective case (already generated)"""
-    if session_id not in active_sessions:
+    session = await asyncio.to_thread(active_sessions.get, session_id)
+    if session is None:
         return JSONResponse({"error": "Session not found"}, status_code=404)
     
-    session = active_sessions[session_id]
-    
     if not session.master:
         return JSONResponse({"error": "Master practice not available"}, status_code=400)
     
     result = score_master(session.master, data.answers)
     
-    if not session.master_completed:
-        session.master_completed = True
-        add_xp(result["xp_earned"], "Master practice completed")
-        increment_stat("masters")
-        session.total_xp_earned += result["xp_earned"]
-    
-    session.current_mode = "detective"
+    if await asyncio.to_thread(active_sessions.claim_phase, session, "master", result["xp_earned"], "detective"):
+        await progress_writer.apply(
+            xp=result["xp_earned"],
+            reason="Master practice completed",
+            stats=["masters"],
+            user_key=request.state.user_key
+        )
     
     # Detective was already generated with the session
-    return {
-        **result,
-        "next_mode": "detective",
-        "detective": {
-            "case_title": session.detective.case_title,
-            "scenario": session.detective.scenario,
-            "clues": [{"id": c.id, "description": c.description} for c in session.detective.clues],
-            "question": session.detective.question,
-            "xp_reward": session.detective.xp_reward
-        }
-    }
+    return phase_response({**result, "next_mode": "detective"}, "detective", session.detective, session.content_ref)
 
 @app.post("/api/session/{session_id}/solve-case")
-async def solve_detective_case(session_id: str, data: DetectiveAnswer):
+async def solve_detective_case(session_id: str, data: DetectiveAnswer, request: Request):
     """Submit detective case answer"""
-    if session_id not in active_sessions:
+    session = await asyncio.to_thread(active_sessions.get, session_id)
+    if session is None:
         return JSONResponse({"error": "Session not found"}, status_code=404)
     
-    session = active_sessions[session_id]
-    
     if not session.detective:
         return JSONResponse({"error": "Detective case not available"}, status_code=400)
     
     result = solve_case(session.detective, data.answer)
     
-    if not session.detective_completed:
-        session.detective_completed = True
-        add_xp(result["xp_earned"], "Detective case completed")
-        increment_stat("cases")
-        session.total_xp_earned += result["xp_earned"]
-        
-        if result["solved"]:
-            unlock_achievement("detective")
+    if await asyncio.to_thread(active_sessions.claim_phase, session, "detective", result["xp_earned"]):
+        await progress_writer.apply(
+            xp=result["xp_earned"],
+            reason="Detective case completed",
+            stats=["cases"],
+            achievements=["detective"] if result["solved"] else [],
+            user_key=request.state.user_key
+        )
     
     return {
         **result,
@@ -344,10 +485,9 @@ async def solve_detective_case(session_id: str, data: DetectiveAnswer):
 @app.get("/api/session/{session_id}")
 async def get_session(session_id: str):
     """Get current session state"""
-    if session_id not in active_sessions:
+    session = await asyncio.to_thread(active_sessions.get, session_id)
+    if session is None:
         return JSONResponse({"error": "Session not found"}, status_code=404)
-    
-    session = active_sessions[session_id]
     return {
         "session_id": session.session_id,
         "topic": session.topic,
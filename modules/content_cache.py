@@ -0,0 +1,230 @@
+"""Content Cache - in-memory LRU backed by SQLite for generated sessions"""
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import select
+
+from gamification.database import SessionLocal, engine
+from gamification.models_db import Base, CachedContent
+from gamification.models import Story, Quiz, MasterPractice, DetectiveCase
+
+Base.metadata.create_all(bind=engine, tables=[CachedContent.__table__])
+
+CONTENT_FIELDS = {
+    "story": Story,
+    "quiz": Quiz,
+    "master": MasterPractice,
+    "detective": DetectiveCase,
+}
+
+def normalize_topic(topic: str) -> str:
+    """Normalize a topic into a cache key ("  Photosynthesis! " -> "photosynthesis")
+
+    "+" and "#" at the end of a word are kept: "C++", "C#" and "C" are different topics.
+    """
+    topic = re.sub(r"[^\w\s+#]|(?<![\w+#])[+#]", " ", topic.lower())
+    return " ".join(topic.split())
+
+
+class ContentCache:
+    """Two-tier cache for parsed AI content
+    
+    Memory tier: bounded LRU of parsed model objects (fast path, no parsing).
+    SQLite tier: JSON rows shared by every worker, bounded by row count.
+    Both tiers honour the same TTL.
+    """
+    
+    def __init__(self, max_entries: int = 256, max_rows: int = 5000, ttl: float = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries = OrderedDict()  # topic_key -> (expires_at, content)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.evictions = 0
+        self.db_evictions = 0
+        self.expirations = 0
+    
+    def get(self, topic: str) -> dict | None:
+        """Return cached content for a topic, or None on miss/expiry"""
+        key = normalize_topic(topic)
+        now = time.time()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                expires_at, content = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return dict(content)
+                del self._entries[key]
+                self.expirations += 1
+        
+        content, expires_at = self._load(key, now)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db_hits += 1
+            self._remember(key, expires_at, content)
+        return dict(content)
+    
+    def put(self, topic: str, content: dict) -> None:
+        """Store successfully generated content for a topic"""
+        key = normalize_topic(topic)
+        now = time.time()
+        expires_at = now + self.ttl
+        cached = {field: content[field] for field in CONTENT_FIELDS}
+        cached.update(success=True, source="cache")
+        
+        with self._lock:
+            self._remember(key, expires_at, cached)
+        self._store(key, topic, cached, now, expires_at)
+    
+    def expires_at(self, topic: str) -> float | None:
+        """When a topic's fresh entry expires - None if not cached. Doesn't touch counters."""
+        key = normalize_topic(topic)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[0]
+        db = SessionLocal()
+        try:
+            row = db.get(CachedContent, key)
+            return row.expires_at if row and row.expires_at > now else None
+        finally:
+            db.close()
+    
+    def expiring(self, within: float, limit: int = 50) -> list[tuple[str, str]]:
+        """(topic_key, topic) of fresh entries expiring in the next `within` seconds, most recently used first"""
+        now = time.time()
+        db = SessionLocal()
+        try:
+            rows = (db.query(CachedContent.topic_key, CachedContent.topic)
+                    .filter(CachedContent.expires_at > now, CachedContent.expires_at <= now + within)
+                    .order_by(CachedContent.last_used_at.desc())
+                    .limit(limit)
+                    .all())
+            return [(row.topic_key, row.topic) for row in rows]
+        finally:
+            db.close()
+    
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "evictions": self.evictions,
+                "db_evictions": self.db_evictions,
+                "expirations": self.expirations,
+                "memory_entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+    
+    def clear(self) -> None:
+        """Drop both tiers (mainly for maintenance)"""
+        with self._lock:
+            self._entries.clear()
+        db = SessionLocal()
+        try:
+            db.query(CachedContent).delete()
+            db.commit()
+        finally:
+            db.close()
+    
+    def _remember(self, key: str, expires_at: float, content: dict) -> None:
+        # Caller holds self._lock
+        self._entries[key] = (expires_at, content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _load(self, key: str, now: float) -> tuple[dict | None, float]:
+        db = SessionLocal()
+        try:
+            row = db.get(CachedContent, key)
+            if not row:
+                return None, 0.0
+            if row.expires_at <= now:
+                db.delete(row)
+                db.commit()
+                with self._lock:
+                    self.expirations += 1
+                return None, 0.0
+            row.last_used_at = now
+            db.commit()
+            return deserialize_content(row.payload), row.expires_at
+        except Exception as e:
+            print(f"[CACHE] Load failed for '{key}': {type(e).__name__}: {e}")
+            return None, 0.0
+        finally:
+            db.close()
+    
+    def _store(self, key: str, topic: str, content: dict, now: float, expires_at: float) -> None:
+        db = SessionLocal()
+        try:
+            db.merge(CachedContent(
+                topic_key=key,
+                topic=topic,
+                payload=serialize_content(content),
+                created_at=now,
+                expires_at=expires_at,
+                last_used_at=now
+            ))
+            db.commit()
+            self._trim(db, now)
+        except Exception as e:
+            db.rollback()
+            print(f"[CACHE] Store failed for '{key}': {type(e).__name__}: {e}")
+        finally:
+            db.close()
+    
+    def _trim(self, db, now: float) -> None:
+        """Drop expired rows, then least recently used rows beyond max_rows"""
+        expired = db.query(CachedContent).filter(CachedContent.expires_at <= now).delete()
+        overflow = db.query(CachedContent).count() - self.max_rows
+        if overflow > 0:
+            stale = (select(CachedContent.topic_key)
+                     .order_by(CachedContent.last_used_at)
+                     .limit(overflow))
+            db.query(CachedContent).filter(CachedContent.topic_key.in_(stale)).delete(synchronize_session=False)
+            with self._lock:
+                self.db_evictions += overflow
+        if expired or overflow > 0:
+            db.commit()
+
+
+def serialize_content(content: dict) -> str:
+    """Dump parsed content models into a JSON string"""
+    return json.dumps({field: content[field].model_dump() for field in CONTENT_FIELDS})
+
+
+def deserialize_content(payload: str) -> dict:
+    """Rebuild parsed content models from serialize_content output"""
+    data = json.loads(payload)
+    content = {field: model.model_validate(data[field]) for field, model in CONTENT_FIELDS.items()}
+    content.update(success=True, source="cache")
+    return content
+
+
+content_cache = ContentCache(
+    max_entries=int(os.getenv("CONTENT_CACHE_MAX_ENTRIES", "256")),
+    max_rows=int(os.getenv("CONTENT_CACHE_MAX_ROWS", "5000")),
+    ttl=float(os.getenv("CONTENT_CACHE_TTL", str(7 * 24 * 3600))),
+)
@@ -0,0 +1,139 @@
+"""Content Store - immutable, content-addressed phase content that sessions point at"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from gamification.database import engine
+from gamification.models_db import Base, ContentBlob, StoredSession
+from modules.content_cache import CONTENT_FIELDS, serialize_content, deserialize_content
+from modules.prebuilt_quests import get_featured_quest
+
+Base.metadata.create_all(bind=engine, tables=[ContentBlob.__table__])
+
+QUEST_PREFIX = "quest:"
+HASH_PREFIX = "sha256:"
+
+
+def quest_ref(quest_id: str, level: int, version: str) -> str:
+    """Reference to a pre-built quest level of a quest pack version ("quest:python:2@1")"""
+    return f"{QUEST_PREFIX}{quest_id}:{level}@{version}"
+
+
+class ContentStore:
+    """Story/quiz/master/detective bundles, shared by every session that uses them
+
+    A session stores only a reference:
+      - "quest:<id>:<level>@<version>" for pre-built quests, resolved from that
+        quest pack version (so a session keeps its content when a new pack
+        is activated; refs without a version use the active pack)
+      - "sha256:<hex>" for AI content, the hash of its serialized form
+
+    Hashed bundles live in a bounded in-memory LRU and in SQLite, so any
+    worker can resolve a reference another worker created. Bundles are
+    never modified; sweep() deletes rows no stored session references once
+    they've been idle for `min_age` seconds.
+    """
+
+    def __init__(self, max_entries: int = 512, min_age: float = 2 * 3600.0, bind=engine):
+        self.max_entries = max_entries
+        self.min_age = min_age
+        self.engine = bind
+        self._entries = OrderedDict()  # ref -> (stored_at, content)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_loads = 0
+        self.db_writes = 0
+        self.deleted = 0
+
+    def put(self, content: dict) -> str:
+        """Store a content bundle (if new) and return its reference"""
+        if content.get("content_ref"):
+            return content["content_ref"]
+
+        payload = serialize_content(content)
+        ref = HASH_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(ref)
+            # Re-touch the row now and then so sweep() never races a live reference
+            fresh = entry is not None and now - entry[0] < self.min_age / 2
+            self._remember(ref, now if not fresh else entry[0],
+                           entry[1] if entry else {field: content[field] for field in CONTENT_FIELDS})
+        if not fresh:
+            stmt = insert(ContentBlob).values(content_ref=ref, payload=payload, last_used_at=now)
+            stmt = stmt.on_conflict_do_update(index_elements=[ContentBlob.content_ref], set_={"last_used_at": now})
+            with self.engine.begin() as conn:
+                conn.execute(stmt)
+            self.db_writes += 1
+        return ref
+
+    def get(self, ref: str) -> dict | None:
+        """The content bundle behind a reference - None if it's unknown"""
+        if ref.startswith(QUEST_PREFIX):
+            location, _, version = ref[len(QUEST_PREFIX):].partition("@")
+            quest_id, _, level = location.rpartition(":")
+            quest = get_featured_quest(quest_id, int(level), version or None)
+            return {field: quest[field] for field in CONTENT_FIELDS} if quest else None
+
+        with self._lock:
+            entry = self._entries.get(ref)
+            if entry:
+                self._entries.move_to_end(ref)
+                self.hits += 1
+                return entry[1]
+
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(ContentBlob.payload, ContentBlob.last_used_at).where(ContentBlob.content_ref == ref)
+            ).first()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.db_loads += 1
+            content = {field: value for field, value in deserialize_content(row.payload).items()
+                       if field in CONTENT_FIELDS}
+            self._remember(ref, row.last_used_at, content)
+            return content
+
+    def sweep(self) -> int:
+        """Delete bundles that no stored session references and nobody used recently"""
+        referenced = select(StoredSession.content_ref).where(StoredSession.content_ref.is_not(None))
+        with self.engine.begin() as conn:
+            deleted = conn.execute(
+                delete(ContentBlob).where(
+                    ContentBlob.last_used_at <= time.time() - self.min_age,
+                    ContentBlob.content_ref.not_in(referenced)
+                )
+            ).rowcount
+        self.deleted += deleted
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "db_loads": self.db_loads,
+                "db_writes": self.db_writes,
+                "deleted": self.deleted,
+            }
+
+    def _remember(self, ref: str, stored_at: float, content: dict) -> None:
+        # Caller holds self._lock
+        self._entries[ref] = (stored_at, content)
+        self._entries.move_to_end(ref)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+content_store = ContentStore(
+    max_entries=int(os.getenv("CONTENT_STORE_MAX_ENTRIES", "512")),
+    min_age=float(os.getenv("SESSION_TTL", str(2 * 3600))),
+)
@@ -1,20 +1,11 @@
 """Detective Mode - Mystery solving with learned knowledge"""
-import os
 import json
 import re
 import time
 from typing import List
-from dotenv import load_dotenv
-from openai import OpenAI
+from modules.llm_clients import get_client
 from gamification.models import DetectiveCase, Clue
 
-# Load environment variables and configure OpenRouter
-load_dotenv()
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY")
-)
-
 MODEL = "google/gemini-2.0-flash-exp:free"
 
 def generate_detective_case(topic: str, key_facts: List[str]) -> DetectiveCase:
@@ -32,7 +23,7 @@ Return JSON only:
 
     for attempt in range(2):
         try:
-            response = client.chat.completions.create(
+            response = get_client().chat.completions.create(
                 model=MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=800
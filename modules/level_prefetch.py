@@ -0,0 +1,74 @@
+"""Level Prefetch - gets a quest's next level ready while the user is finishing the current one"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List
+
+from modules.content_cache import normalize_topic
+
+
+def next_level_topic(topic: str, level: int) -> str:
+    """The topic the browser asks for when moving on to `level` (startNextLevel in static/js/app.js)"""
+    return f"{topic.split('(')[0].strip()} (Level {level} - Advanced)"
+
+
+class LevelPrefetcher:
+    """Background preparation of next levels
+
+    prefetch() returns straight away; `prepare(topic, key_facts)` does the
+    work - loading a pre-built level or generating one - and returns what it
+    did ("prebuilt", "generated", "cached", ...), which is counted.
+
+    A topic already being prepared isn't started twice, and at most
+    `max_in_flight` run at once. Beyond that the next level is skipped and
+    simply loads on demand when the user gets there.
+    """
+
+    def __init__(self, prepare: Callable[[str, List[str]], Awaitable[str]], max_in_flight: int = 2):
+        self.prepare = prepare
+        self.max_in_flight = max_in_flight
+        self._active = set()   # normalized topics being prepared
+        self._tasks = set()
+        self.started = 0
+        self.skipped_busy = 0
+        self.failed = 0
+        self.outcomes: Dict[str, int] = {}
+
+    def prefetch(self, topic: str, key_facts: List[str]) -> bool:
+        """Start preparing `topic` in the background - False if it's already running or over budget"""
+        key = normalize_topic(topic)
+        if key in self._active:
+            return False
+        if len(self._active) >= self.max_in_flight:
+            self.skipped_busy += 1
+            return False
+        self._active.add(key)
+        self.started += 1
+        task = asyncio.create_task(self._prepare(key, topic, key_facts))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._active),
+            "started": self.started,
+            "skipped_busy": self.skipped_busy,
+            "failed": self.failed,
+            "outcomes": dict(self.outcomes),
+            "max_in_flight": self.max_in_flight,
+        }
+
+    async def _prepare(self, key: str, topic: str, key_facts: List[str]) -> None:
+        try:
+            outcome = await self.prepare(topic, key_facts)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            print(f"[PREFETCH] {topic}: {outcome}")
+        except Exception as e:
+            self.failed += 1
+            print(f"[PREFETCH] Failed for '{topic}': {type(e).__name__}: {e}")
+        finally:
+            self._active.discard(key)
@@ -0,0 +1,222 @@
+"""LLM Clients - shared, keep-alive OpenRouter clients (one connection pool per API key)"""
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+load_dotenv()
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# 60 second timeout, 10 second connect
+DEFAULT_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=120.0)
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+
+class ClientPool:
+    """One OpenAI + AsyncOpenAI client pair per API key, reused across requests
+    
+    The server key's clients live for the whole process. Per-user keys sit in
+    an LRU: clients idle longer than `idle_ttl` seconds, or beyond
+    `max_user_clients`, are dropped. A dropped client still leased by a
+    request (see lease()) is closed when its last lease is released, so
+    eviction never pulls the connection pool out from under a request.
+    
+    Async clients are tied to the event loop that created them - fine for
+    uvicorn/gunicorn workers, which run a single loop each. That loop is
+    remembered so a client evicted from another thread is closed on it.
+    """
+    
+    def __init__(self, max_user_clients: int = 64, idle_ttl: float = 600.0):
+        self.max_user_clients = max_user_clients
+        self.idle_ttl = idle_ttl
+        self._server = {}                # kind -> client, for the server key
+        self._users = OrderedDict()      # (kind, api_key) -> (last_used, client)
+        self._leases = {}                # client -> requests using it
+        self._retired = set()            # evicted clients waiting for their leases to end
+        self._loops = {}                 # async client -> event loop it was created on
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+    
+    def get(self, api_key: str) -> OpenAI:
+        return self._get("sync", api_key)
+    
+    def get_async(self, api_key: str) -> AsyncOpenAI:
+        return self._get("async", api_key)
+    
+    @contextmanager
+    def lease(self, kind: str, api_key: str):
+        """Hold a client ("sync" or "async") for the length of a request - it isn't closed until released"""
+        client = self._get(kind, api_key, hold=True)
+        try:
+            yield client
+        finally:
+            self._release(client)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "server_clients": len(self._server),
+                "user_clients": len(self._users),
+                "created": self.created,
+                "evicted": self.evicted,
+                "leased": sum(self._leases.values()),
+                "retired": len(self._retired),
+                "http2": HTTP2_ENABLED,
+            }
+    
+    def _get(self, kind: str, api_key: str, hold: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if api_key == os.getenv("OPENROUTER_API_KEY"):
+                client = self._server.get((kind, api_key))
+                if client is None:
+                    client = self._server[(kind, api_key)] = self._create(kind, api_key)
+                return client  # Never evicted, so no lease to count
+            
+            key = (kind, api_key)
+            entry = self._users.get(key)
+            if entry:
+                client = entry[1]
+                self._users[key] = (now, client)
+                self._users.move_to_end(key)
+            else:
+                client = self._create(kind, api_key)
+                self._users[key] = (now, client)
+            if hold:
+                self._leases[client] = self._leases.get(client, 0) + 1
+            
+            idle = self._evict(now)
+        
+        for old, loop in idle:
+            close_client(old, loop)
+        return client
+    
+    def _release(self, client) -> None:
+        with self._lock:
+            count = self._leases.get(client, 0) - 1
+            if count > 0:
+                self._leases[client] = count
+                return
+            self._leases.pop(client, None)
+            if client not in self._retired:
+                return
+            self._retired.discard(client)
+            loop = self._loops.pop(client, None)
+        close_client(client, loop)
+    
+    def _evict(self, now: float) -> list:
+        """Drop expired/excess user clients - returns (client, loop) for the ones nobody is using, to close"""
+        # Caller holds self._lock; oldest entries are first
+        idle = []
+        while self._users:
+            key, (last_used, client) = next(iter(self._users.items()))
+            if len(self._users) <= self.max_user_clients and now - last_used < self.idle_ttl:
+                break
+            del self._users[key]
+            self.evicted += 1
+            if client in self._leases:
+                self._retired.add(client)  # Closed by _release once its requests finish
+            else:
+                idle.append((client, self._loops.pop(client, None)))
+        return idle
+    
+    def _create(self, kind: str, api_key: str):
+        self.created += 1
+        if kind == "async":
+            client = AsyncOpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=api_key,
+                timeout=DEFAULT_TIMEOUT,
+                http_client=DefaultAsyncHttpxClient(http2=HTTP2_ENABLED, limits=POOL_LIMITS, timeout=DEFAULT_TIMEOUT)
+            )
+            try:
+                self._loops[client] = asyncio.get_running_loop()
+            except RuntimeError:
+                pass  # Created outside a loop - closed wherever it is evicted
+            return client
+        return OpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=api_key,
+            timeout=DEFAULT_TIMEOUT,
+            http_client=DefaultHttpxClient(http2=HTTP2_ENABLED, limits=POOL_LIMITS, timeout=DEFAULT_TIMEOUT)
+        )
+
+
+# Pending async closes - the loop only keeps weak references to its tasks
+_closing = set()
+
+
+def close_client(client, loop: asyncio.AbstractEventLoop = None) -> None:
+    """Close an evicted client's connection pool without blocking
+
+    An async client is closed on `loop`, the loop it was created on:
+    as a task when called from that loop, handed over to it from any other
+    thread. Without a usable loop it is closed right here.
+    """
+    try:
+        if not isinstance(client, AsyncOpenAI):
+            client.close()
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is None or not loop.is_running():
+            loop = running
+        if loop is None:
+            asyncio.run(client.close())  # Its loop is gone - nothing else will close it
+            return
+        if loop is running:
+            pending = loop.create_task(client.close())
+        else:
+            pending = asyncio.run_coroutine_threadsafe(client.close(), loop)
+        _closing.add(pending)
+        pending.add_done_callback(_closed)
+    except Exception as e:
+        print(f"[CLIENTS] Close failed: {type(e).__name__}: {e}")
+
+
+def _closed(pending) -> None:
+    _closing.discard(pending)
+    if not pending.cancelled() and pending.exception() is not None:
+        error = pending.exception()
+        print(f"[CLIENTS] Close failed: {type(error).__name__}: {error}")
+
+
+client_pool = ClientPool(
+    max_user_clients=int(os.getenv("LLM_MAX_USER_CLIENTS", "64")),
+    idle_ttl=float(os.getenv("LLM_CLIENT_IDLE_TTL", "600")),
+)
+
+
+def get_client(api_key: str = None) -> OpenAI | None:
+    """Shared sync client for a key (defaults to the server key) - None without any key
+    
+    A user key's client can be evicted while in use; hold it with client_pool.lease() instead.
+    """
+    api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+    return client_pool.get(api_key) if api_key else None
+
+
+def get_async_client(api_key: str = None) -> AsyncOpenAI | None:
+    """Shared async client for a key (defaults to the server key) - None without any key
+    
+    A user key's client can be evicted while in use; hold it with client_pool.lease() instead.
+    """
+    api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+    return client_pool.get_async(api_key) if api_key else None
@@ -1,20 +1,11 @@
 """Master Mode - Advanced practice questions"""
-import os
 import json
 import re
 import time
 from typing import List
-from dotenv import load_dotenv
-from openai import OpenAI
+from modules.llm_clients import get_client
 from gamification.models import MasterPractice, MasterQuestion
 
-# Load environment variables and configure OpenRouter
-load_dotenv()
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY")
-)
-
 MODEL = "google/gemini-2.0-flash-exp:free"
 
 def generate_master_practice(topic: str, key_facts: List[str]) -> MasterPractice:
@@ -34,7 +25,7 @@ Return JSON only:
 
     for attempt in range(2):
         try:
-            response = client.chat.completions.create(
+            response = get_client().chat.completions.create(
                 model=MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=1000
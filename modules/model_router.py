@@ -0,0 +1,204 @@
+"""Model Router - health tracking, circuit breakers and latency-based ordering for AI models"""
+import os
+import time
+import threading
+from collections import deque
+from typing import Dict, List
+
+# Outcomes reported by the generator for each model call
+SUCCESS = "success"
+ERROR = "error"
+TIMEOUT = "timeout"
+PARSE_FAILURE = "parse_failure"
+CANCELLED = "cancelled"  # Lost a hedged race - says nothing about the model's health
+CLIENT_ERROR = "client_error"  # Request or API key refused (bad key, no credits) - not the model's fault either
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelHealth:
+    """Rolling health of one model"""
+
+    def __init__(self, model: str, position: int, window: int):
+        self.model = model
+        self.position = position       # Place in the configured MODELS list (tie-break)
+        self.outcomes = deque(maxlen=window)
+        self.latency_ewma = None       # Seconds, successful calls only
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self.probe_claimed_at = None   # When a request took the half-open probe
+        self.calls = 0
+        self.client_errors = 0
+
+    def rate(self, outcome: str) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for o in self.outcomes if o == outcome) / len(self.outcomes)
+
+    def success_rate(self) -> float:
+        return self.rate(SUCCESS) if self.outcomes else 1.0
+
+    def smoothed_success_rate(self) -> float:
+        """Laplace-smoothed, so one early failure doesn't bury a model for good"""
+        successes = sum(1 for o in self.outcomes if o == SUCCESS)
+        return (successes + 1) / (len(self.outcomes) + 2)
+
+
+class ModelRouter:
+    """Order models so the fastest healthy one is tried first
+
+    Each model keeps a rolling window of outcomes and an EWMA of successful
+    latency. Its score is the expected time to a usable answer:
+    latency / success_rate (smoothed). Models with no data yet use
+    `default_latency` so they still get a chance.
+
+    Circuit breaker: `failure_threshold` consecutive failures (or a failure
+    rate above `max_failure_rate` over a full window) opens the circuit and
+    the model is skipped. After a cooldown - doubling with every trip, up
+    to `max_cooldown` - it goes half-open and exactly one request probes it:
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, models: List[str], window: int = 20, failure_threshold: int = 3,
+                 max_failure_rate: float = 0.5, cooldown: float = 30.0, max_cooldown: float = 600.0,
+                 default_latency: float = 15.0, ewma_alpha: float = 0.3, probe_timeout: float = 90.0):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.max_failure_rate = max_failure_rate
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.default_latency = default_latency
+        self.ewma_alpha = ewma_alpha
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._health: Dict[str, ModelHealth] = {}
+        for model in models:
+            self._ensure(model)
+
+    def ordered_models(self) -> List[str]:
+        """Models to try for the next request, best first
+
+        Open circuits are left out. A half-open model goes first - it is the
+        trial request - but only if nobody else is probing it; including it
+        claims the probe (claims expire after `probe_timeout`). With hedging
+        on, a bad probe only costs the hedge delay. If every circuit is open,
+        all models are returned so requests still get a chance instead of
+        failing outright.
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = []
+            probes = []
+            for health in self._health.values():
+                if health.state == OPEN and now - health.opened_at >= self._cooldown_for(health):
+                    health.state = HALF_OPEN
+                    health.probe_claimed_at = None
+                if health.state == CLOSED:
+                    healthy.append(health)
+                elif health.state == HALF_OPEN and (health.probe_claimed_at is None or
+                                                    now - health.probe_claimed_at > self.probe_timeout):
+                    health.probe_claimed_at = now
+                    probes.append(health)
+
+            healthy.sort(key=lambda h: (self._score(h), h.position))
+            ordered = probes + healthy
+            if not ordered:
+                ordered = sorted(self._health.values(), key=lambda h: h.opened_at)
+            return [h.model for h in ordered]
+
+    def record(self, model: str, outcome: str, latency: float = None) -> None:
+        """Report how a call to `model` went"""
+        now = time.monotonic()
+        with self._lock:
+            health = self._ensure(model)
+            was_probe = health.state == HALF_OPEN
+            health.probe_claimed_at = None
+
+            if outcome == CANCELLED:
+                return
+            if outcome == CLIENT_ERROR:
+                # One user's bad key must not trip the breakers every request shares
+                health.client_errors += 1
+                return
+
+            health.calls += 1
+            health.outcomes.append(outcome)
+
+            if outcome == SUCCESS:
+                health.consecutive_failures = 0
+                if latency is not None:
+                    if health.latency_ewma is None:
+                        health.latency_ewma = latency
+                    else:
+                        health.latency_ewma += self.ewma_alpha * (latency - health.latency_ewma)
+                if was_probe or health.state == OPEN:
+                    print(f"[ROUTER] {model} recovered - circuit closed")
+                health.state = CLOSED
+                health.trips = 0
+                return
+
+            health.consecutive_failures += 1
+            window_full = len(health.outcomes) == self.window
+            failing = (health.consecutive_failures >= self.failure_threshold or
+                       (window_full and 1 - health.success_rate() > self.max_failure_rate))
+            if was_probe or (health.state == CLOSED and failing):
+                health.state = OPEN
+                health.opened_at = now
+                health.trips += 1
+                print(f"[ROUTER] {model} circuit open for {self._cooldown_for(health):.0f}s ({outcome})")
+
+    def snapshot(self) -> dict:
+        """Router state for inspection"""
+        now = time.monotonic()
+        with self._lock:
+            models = []
+            for health in self._health.values():
+                cooldown_left = 0.0
+                if health.state == OPEN:
+                    cooldown_left = max(0.0, self._cooldown_for(health) - (now - health.opened_at))
+                models.append({
+                    "model": health.model,
+                    "state": health.state,
+                    "score": round(self._score(health), 3),
+                    "calls": health.calls,
+                    "client_errors": health.client_errors,
+                    "success_rate": round(health.success_rate(), 3),
+                    "parse_failure_rate": round(health.rate(PARSE_FAILURE), 3),
+                    "timeout_rate": round(health.rate(TIMEOUT), 3),
+                    "latency_ewma": round(health.latency_ewma, 3) if health.latency_ewma is not None else None,
+                    "consecutive_failures": health.consecutive_failures,
+                    "trips": health.trips,
+                    "cooldown_left": round(cooldown_left, 1),
+                })
+            models.sort(key=lambda m: m["score"])
+        return {"models": models}
+
+    def _ensure(self, model: str) -> ModelHealth:
+        # Caller holds self._lock (or is __init__)
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth(model, len(self._health), self.window)
+        return health
+
+    def _score(self, health: ModelHealth) -> float:
+        latency = health.latency_ewma if health.latency_ewma is not None else self.default_latency
+        return latency / health.smoothed_success_rate()
+
+    def _cooldown_for(self, health: ModelHealth) -> float:
+        return min(self.cooldown * (2 ** max(health.trips - 1, 0)), self.max_cooldown)
+
+
+def create_router(models: List[str]) -> ModelRouter:
+    """Router configured from the environment"""
+    return ModelRouter(
+        models,
+        window=int(os.getenv("ROUTER_WINDOW", "20")),
+        failure_threshold=int(os.getenv("ROUTER_FAILURE_THRESHOLD", "3")),
+        cooldown=float(os.getenv("ROUTER_COOLDOWN", "30")),
+        max_cooldown=float(os.getenv("ROUTER_MAX_COOLDOWN", "600")),
+    )
@@ -0,0 +1,118 @@
+"""Phase Payloads - what the browser sees of each phase (never the answers), pre-encoded per content"""
+import os
+import json
+import threading
+from collections import OrderedDict
+from fastapi.responses import Response
+
+
+def story_payload(story) -> dict:
+    return {
+        "title": story.title,
+        "content": story.content,
+        "xp_reward": story.xp_reward
+    }
+
+def quiz_payload(quiz) -> dict:
+    return {
+        "questions": [
+            {"question": q.question, "options": q.options}
+            for q in quiz.questions
+        ],
+        "total_xp": quiz.total_xp
+    }
+
+def master_payload(master) -> dict:
+    return {
+        "questions": [
+            {"question": q.question, "options": q.options}
+            for q in master.questions
+        ],
+        "total_xp": master.total_xp
+    }
+
+def detective_payload(detective) -> dict:
+    return {
+        "case_title": detective.case_title,
+        "scenario": detective.scenario,
+        "clues": [{"id": c.id, "description": c.description} for c in detective.clues],
+        "question": detective.question,
+        "xp_reward": detective.xp_reward
+    }
+
+PHASE_PAYLOADS = {
+    "story": story_payload,
+    "quiz": quiz_payload,
+    "master": master_payload,
+    "detective": detective_payload,
+}
+
+
+def encode_json(data) -> bytes:
+    """JSON bytes exactly as FastAPI's JSONResponse renders them"""
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class PayloadCache:
+    """Encoded phase payloads per (content_ref, phase)
+
+    Content behind a ref never changes (pre-built quest levels and
+    content-addressed bundles alike), so its answer-free payload is built
+    and JSON-encoded once and reused by every session on that content.
+    Bounded LRU - pre-built levels stay hot, one-off AI bundles age out.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (content_ref, phase) -> bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, content_ref: str | None, phase: str, model) -> bytes:
+        """Encoded payload of a phase model - cached when the content has a ref"""
+        if content_ref is None:
+            return encode_json(PHASE_PAYLOADS[phase](model))
+        key = (content_ref, phase)
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return encoded
+
+        encoded = encode_json(PHASE_PAYLOADS[phase](model))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = encoded
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return encoded
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+payload_cache = PayloadCache(max_entries=int(os.getenv("PAYLOAD_CACHE_MAX_ENTRIES", "512")))
+
+
+def phase_response(fields: dict, phase: str, model, content_ref: str | None) -> Response:
+    """JSON response of per-request `fields` plus the phase payload under `phase`
+
+    Only `fields` is encoded per request; the payload bytes are spliced in
+    from the cache. The body is byte-identical to returning
+    {**fields, phase: PHASE_PAYLOADS[phase](model)}.
+    """
+    head = encode_json(fields)[:-1]
+    if len(head) > 1:
+        head += b","
+    body = b"".join((head, encode_json(phase), b":", payload_cache.get(content_ref, phase, model), b"}"))
+    return Response(content=body, media_type="application/json")
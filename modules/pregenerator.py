@@ -0,0 +1,278 @@
+"""Pre-generator - background generation of trending custom topics
+
+Trend counts and generation leases live in SQLite, so the workers of a
+multi-worker deployment count requests together and share one
+pre-generation budget instead of each spending its own.
+"""
+import time
+import asyncio
+from typing import Awaitable, Callable, List, Tuple
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.dialects.sqlite import insert
+
+from gamification.database import engine
+from gamification.models_db import Base, TopicTrend, PregenLease
+from modules.content_cache import ContentCache, normalize_topic
+
+Base.metadata.create_all(bind=engine, tables=[TopicTrend.__table__, PregenLease.__table__])
+
+# GenerationLeases.claim() outcomes
+CLAIMED = "claimed"
+TAKEN = "taken"              # Another worker generates (or recently generated) this topic
+OVER_BUDGET = "over_budget"  # All workers together are at the concurrency or rate limit
+
+
+class TopicTrends:
+    """Sliding-window request counts per normalized topic, shared by every worker
+    
+    Requests are counted in one-minute buckets (an upsert per request), so
+    the window slides a minute at a time.
+    """
+    
+    BUCKET = 60
+    
+    def __init__(self, window: float = 3600.0, bind=engine):
+        self.window = window
+        self.engine = bind
+    
+    def _cutoff(self) -> int:
+        return int((time.time() - self.window) // self.BUCKET)
+    
+    def record(self, topic: str) -> None:
+        key = normalize_topic(topic)
+        if not key:
+            return
+        stmt = insert(TopicTrend).values(topic_key=key, bucket=int(time.time() // self.BUCKET), topic=topic, requests=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TopicTrend.topic_key, TopicTrend.bucket],
+            set_={"requests": TopicTrend.requests + 1, "topic": stmt.excluded.topic}
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+    
+    def count(self, key: str) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.coalesce(func.sum(TopicTrend.requests), 0))
+                .where(TopicTrend.topic_key == key, TopicTrend.bucket >= self._cutoff())
+            ).scalar()
+    
+    def topic(self, key: str) -> str:
+        with self.engine.connect() as conn:
+            topic = conn.execute(
+                select(TopicTrend.topic).where(TopicTrend.topic_key == key)
+                .order_by(TopicTrend.bucket.desc()).limit(1)
+            ).scalar()
+        return topic or key
+    
+    def trending(self, threshold: int, limit: int = 50) -> List[Tuple[str, str, int]]:
+        """(topic_key, topic, count) with at least `threshold` requests in the window, hottest first"""
+        total = func.sum(TopicTrend.requests)
+        # SQLite takes the bare `topic` column from the row holding max(bucket) - the latest raw topic
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(TopicTrend.topic_key, TopicTrend.topic, total, func.max(TopicTrend.bucket))
+                .where(TopicTrend.bucket >= self._cutoff())
+                .group_by(TopicTrend.topic_key)
+                .having(total >= threshold)
+                .order_by(total.desc())
+                .limit(limit)
+            ).all()
+        return [(key, topic, count) for key, topic, count, _ in rows]
+    
+    def sweep(self) -> int:
+        """Delete buckets that slid out of the window"""
+        with self.engine.begin() as conn:
+            return conn.execute(delete(TopicTrend).where(TopicTrend.bucket < self._cutoff())).rowcount
+
+
+class GenerationLeases:
+    """Cross-worker claims on background generations
+    
+    claim() inserts a lease row for the topic (INSERT ... ON CONFLICT DO
+    NOTHING), so only one worker generates it. In the same transaction it
+    counts the leases of every worker: over `concurrency` running, or
+    `rate_per_minute` claimed in the last minute, and the claim is rolled
+    back. Leases stay until they expire after `ttl` seconds, finished or
+    not - a topic that just failed isn't retried straight away.
+    """
+    
+    def __init__(self, concurrency: int = 1, rate_per_minute: float = 4.0, ttl: float = 900.0, bind=engine):
+        self.concurrency = concurrency
+        self.rate_per_minute = rate_per_minute
+        self.ttl = max(ttl, 60.0)  # Leases are the rate window's history too
+        self.engine = bind
+    
+    def claim(self, key: str) -> str:
+        """CLAIMED, TAKEN or OVER_BUDGET"""
+        now = time.time()
+        with self.engine.connect() as conn:
+            with conn.begin() as transaction:
+                # Writing first takes SQLite's write lock, so the budget counts below can't race another worker
+                conn.execute(delete(PregenLease).where(PregenLease.topic_key == key, PregenLease.expires_at <= now))
+                inserted = conn.execute(
+                    insert(PregenLease)
+                    .values(topic_key=key, claimed_at=now, expires_at=now + self.ttl, running=True)
+                    .on_conflict_do_nothing(index_elements=[PregenLease.topic_key])
+                ).rowcount
+                if not inserted:
+                    return TAKEN
+                running, started = conn.execute(select(
+                    func.count().filter(PregenLease.running.is_(True), PregenLease.expires_at > now),
+                    func.count().filter(PregenLease.claimed_at > now - 60),
+                )).one()
+                if running > self.concurrency or started > self.rate_per_minute:
+                    transaction.rollback()
+                    return OVER_BUDGET
+        return CLAIMED
+    
+    def finish(self, key: str) -> None:
+        """Stop counting a lease as running (it still blocks the topic until it expires)"""
+        with self.engine.begin() as conn:
+            conn.execute(update(PregenLease).where(PregenLease.topic_key == key).values(running=False))
+    
+    def sweep(self) -> int:
+        with self.engine.begin() as conn:
+            return conn.execute(delete(PregenLease).where(PregenLease.expires_at <= time.time())).rowcount
+
+
+class Pregenerator:
+    """Worker that warms the content cache for hot topics - one per worker process
+    
+    Every `interval` seconds it picks topics requested at least `threshold`
+    times in the trend window (by all workers) that aren't cached yet, plus
+    cached popular topics expiring within `refresh_ahead` seconds, and
+    generates them. Results go through `store` (the interactive path's
+    cache_content), so they are also routable for similar topics.
+    
+    It stays out of the way of users: every generation is claimed through
+    `leases`, which caps background generations across all workers
+    (`concurrency` at once, `rate_per_minute` started per minute) and keeps
+    two workers off the same topic; and a tick is skipped entirely while
+    this worker's interactive generations are running (`interactive_in_flight`
+    returns how many).
+    """
+    
+    def __init__(self, generate: Callable[[str], Awaitable[dict]], store: Callable[[str, dict], None],
+                 cache: ContentCache, trends: TopicTrends, leases: GenerationLeases, interactive_in_flight: Callable[[], int],
+                 threshold: int = 3, interval: float = 30.0, refresh_ahead: float = 6 * 3600.0):
+        self.generate = generate
+        self.store = store
+        self.cache = cache
+        self.trends = trends
+        self.leases = leases
+        self.interactive_in_flight = interactive_in_flight
+        self.threshold = threshold
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.running = 0
+        self._active = set()
+        self._tasks = set()   # in-flight generations, cancelled by stop()
+        self._task = None
+        self.trending = 0
+        self.generated = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_busy = 0
+        self.skipped_taken = 0
+        self.skipped_budget = 0
+    
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            print(f"[PREGEN] Started (threshold {self.threshold}, every {self.interval:.0f}s)")
+    
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "generated": self.generated,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped_busy": self.skipped_busy,
+            "skipped_taken": self.skipped_taken,
+            "skipped_budget": self.skipped_budget,
+            "trending_topics": self.trending,
+            "threshold": self.threshold,
+            "concurrency": self.leases.concurrency,
+            "rate_per_minute": self.leases.rate_per_minute,
+        }
+    
+    def sweep(self) -> int:
+        """StoreSweeper hook: drop trend buckets out of the window and expired leases"""
+        return self.trends.sweep() + self.leases.sweep()
+    
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"[PREGEN] Tick failed: {type(e).__name__}: {e}")
+    
+    async def tick(self) -> None:
+        """One scheduling pass - launch whatever the shared budget allows"""
+        # Trends, cache and leases are SQLite reads/writes - keep them off the event loop
+        for key, topic, refresh in await asyncio.to_thread(self.candidates):
+            if self.interactive_in_flight() > self.running:
+                self.skipped_busy += 1
+                return
+            if self.running >= self.leases.concurrency:
+                return
+            claim = await asyncio.to_thread(self.leases.claim, key)
+            if claim == TAKEN:
+                self.skipped_taken += 1
+                continue
+            if claim == OVER_BUDGET:
+                self.skipped_budget += 1
+                return
+            self._active.add(key)
+            self.running += 1
+            task = asyncio.create_task(self._generate(key, topic, refresh))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    def candidates(self) -> List[Tuple[str, str, bool]]:
+        """(topic_key, topic, is_refresh) worth generating now, most valuable first"""
+        picks = []
+        trending = self.trends.trending(self.threshold)
+        self.trending = len(trending)
+        for key, topic, _ in trending:
+            if key not in self._active and self.cache.expires_at(topic) is None:
+                picks.append((key, topic, False))
+        # Never look further ahead than half a TTL, or fresh entries would churn
+        for key, topic in self.cache.expiring(min(self.refresh_ahead, self.cache.ttl / 2)):
+            if key not in self._active and self.trends.count(key) >= self.threshold:
+                picks.append((key, self.trends.topic(key), True))
+        return picks
+    
+    async def _generate(self, key: str, topic: str, refresh: bool) -> None:
+        try:
+            print(f"[PREGEN] {'Refreshing' if refresh else 'Generating'}: {topic}")
+            result = await self.generate(topic)
+            if result.get("success"):
+                await asyncio.to_thread(self.store, topic, result)
+                if refresh:
+                    self.refreshed += 1
+                else:
+                    self.generated += 1
+            else:
+                self.failed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"[PREGEN] Failed for '{topic}': {type(e).__name__}: {e}")
+        finally:
+            self.running -= 1
+            self._active.discard(key)
+            try:
+                await asyncio.to_thread(self.leases.finish, key)
+            except Exception as e:
+                print(f"[PREGEN] Couldn't release lease for '{topic}': {type(e).__name__}: {e}")
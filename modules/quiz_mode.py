@@ -1,19 +1,10 @@
 """Quiz Mode - Generate comprehension questions from story"""
-import os
 import json
 import re
 from typing import List
-from dotenv import load_dotenv
-from openai import OpenAI
+from modules.llm_clients import get_client
 from gamification.models import Quiz, QuizQuestion
 
-# Load environment variables and configure OpenRouter
-load_dotenv()
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY")
-)
-
 MODEL = "google/gemini-2.0-flash-exp:free"
 
 def generate_quiz(topic: str, key_facts: List[str], num_questions: int = 5) -> Quiz:
@@ -30,7 +21,7 @@ IMPORTANT: Return ONLY valid JSON in this exact format, nothing else:
 {{"questions": [{{"question": "Question text?", "options": ["A", "B", "C", "D"], "correct_index": 0, "explanation": "Why correct"}}]}}"""
 
     try:
-        response = client.chat.completions.create(
+        response = get_client().chat.completions.create(
             model=MODEL,
             messages=[{"role": "user", "content": prompt}]
         )
@@ -0,0 +1,379 @@
+"""Session Store - bounded LearningSession storage that every worker process can see"""
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, List
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.dialects.sqlite import insert
+
+from gamification.database import engine, add_missing_column
+from gamification.models_db import Base, StoredSession
+from gamification.models import LearningSession
+from modules.content_cache import CONTENT_FIELDS
+from modules.content_store import ContentStore, content_store
+
+Base.metadata.create_all(bind=engine, tables=[StoredSession.__table__])
+
+# Tables created before sessions referenced shared content lack the column
+add_missing_column(
+    "learning_sessions", "content_ref", "content_ref VARCHAR",
+    "CREATE INDEX IF NOT EXISTS ix_learning_sessions_content_ref ON learning_sessions (content_ref)"
+)
+
+_serializer = LearningSession.__pydantic_serializer__
+
+
+def serialize_session(session: LearningSession) -> bytes:
+    """LearningSession state -> compact JSON bytes (pydantic-core, no intermediate dicts)
+
+    The phase content is excluded - only its content_ref is written.
+    """
+    return _serializer.to_json(session)
+
+
+def deserialize_session(payload: bytes) -> LearningSession:
+    return LearningSession.model_validate_json(payload)
+
+
+# Per-user progress fields that claim_phase() changes
+PROGRESS_FIELDS = ("current_mode", "story_completed", "quiz_completed", "master_completed",
+                   "detective_completed", "total_xp_earned")
+
+
+def complete_phase(state: LearningSession, phase: str, xp: int, next_mode: str | None) -> bool:
+    """Mark a phase completed on `state` unless it already is - True if this call completed it"""
+    flag = f"{phase}_completed"
+    if getattr(state, flag):
+        return False
+    setattr(state, flag, True)
+    state.total_xp_earned += xp
+    if next_mode:
+        state.current_mode = next_mode
+    return True
+
+
+def copy_progress(target: LearningSession, source: LearningSession) -> None:
+    for field in PROGRESS_FIELDS:
+        setattr(target, field, getattr(source, field))
+
+
+class BoundedStore:
+    """In-memory key/value store bounded by size (LRU) and idle time (TTL)
+
+    An entry idle for longer than `ttl` seconds is gone: lookups treat it as
+    missing and sweep() frees it. Past `max_entries`, the least recently
+    used entry is evicted. Touching an entry (get or put) resets its idle
+    clock.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 2 * 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (last_used, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if now - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                return default
+            self._entries[key] = (now, entry[1])
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def sweep(self) -> int:
+        """Drop idle entries - returns how many went"""
+        cutoff = time.monotonic() - self.ttl
+        dropped = 0
+        with self._lock:
+            # Oldest first, so stop at the first entry that's still fresh
+            while self._entries:
+                key, (last_used, _) = next(iter(self._entries.items()))
+                if last_used > cutoff:
+                    break
+                del self._entries[key]
+                dropped += 1
+            self.expirations += dropped
+        return dropped
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MemorySessionStore:
+    """Per-process bounded store - fine for a single worker (uvicorn --reload, tests)"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 2 * 3600.0):
+        self._sessions = BoundedStore(max_entries, ttl)
+        self._claim_lock = threading.Lock()
+
+    def get(self, session_id: str) -> LearningSession | None:
+        return self._sessions.get(session_id)
+
+    def put(self, session: LearningSession) -> None:
+        self._sessions.put(session.session_id, session)
+
+    def claim_phase(self, session: LearningSession, phase: str, xp: int, next_mode: str = None) -> bool:
+        """Complete a phase exactly once - True for the one caller that should award its XP
+
+        `session` is updated with the stored progress either way.
+        """
+        with self._claim_lock:
+            stored = self._sessions.get(session.session_id)
+            if stored is None:
+                return False
+            claimed = complete_phase(stored, phase, xp, next_mode)
+        if stored is not session:
+            copy_progress(session, stored)
+        return claimed
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.delete(session_id)
+
+    def sweep(self) -> int:
+        return self._sessions.sweep()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._sessions.stats()}
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SqliteSessionStore:
+    """Sessions serialized into the shared SQLite database (WAL mode)
+
+    Every gunicorn worker reads and writes the same rows, so a request can
+    land on any worker. A session is one row, rewritten whole on each
+    change - callers must put() after mutating what get() returned.
+
+    claim_phase() is the exception: it updates a row only if it hasn't
+    changed since it was read (compare-and-swap on the payload), so
+    concurrent submissions of one phase complete it exactly once.
+
+    Rows not written for `ttl` seconds are treated as gone and deleted by
+    sweep(), which also trims the least recently written rows beyond
+    `max_rows`. Eviction counters are per worker.
+
+    Rows hold only per-user state (~150 bytes); the phase content is
+    re-attached from `content` by the session's content_ref.
+    """
+
+    def __init__(self, max_rows: int = 100000, ttl: float = 2 * 3600.0, bind=engine,
+                 content: ContentStore = content_store):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.engine = bind
+        self.content = content
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> LearningSession | None:
+        with self.engine.connect() as conn:
+            payload = conn.execute(
+                select(StoredSession.payload).where(
+                    StoredSession.session_id == session_id,
+                    StoredSession.updated_at > time.time() - self.ttl
+                )
+            ).scalar()
+        if payload is None:
+            return None
+        try:
+            session = deserialize_session(payload)
+        except Exception as e:
+            print(f"[SESSIONS] Dropping unreadable session '{session_id}': {type(e).__name__}: {e}")
+            self.delete(session_id)
+            return None
+
+        if session.content_ref:
+            content = self.content.get(session.content_ref)
+            if content is None:
+                print(f"[SESSIONS] Content {session.content_ref} for session '{session_id}' is gone")
+                return None
+            session.story = content["story"]
+            session.quiz = content["quiz"]
+            session.master = content["master"]
+            session.detective = content["detective"]
+        return session
+
+    def backfill_ref(self, session: LearningSession) -> None:
+        """Give a session from a row written before content_ref existed a reference to its content
+
+        Such rows carry the content inline; serializing them as they are
+        would drop it, since only the reference is written.
+        """
+        if session.content_ref is None and session.story is not None:
+            session.content_ref = self.content.put({field: getattr(session, field) for field in CONTENT_FIELDS})
+
+    def put(self, session: LearningSession) -> None:
+        self.backfill_ref(session)
+        payload = serialize_session(session)
+        now = time.time()
+        stmt = insert(StoredSession).values(
+            session_id=session.session_id, payload=payload, content_ref=session.content_ref, updated_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StoredSession.session_id],
+            set_={"payload": payload, "content_ref": session.content_ref, "updated_at": now}
+        )
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def claim_phase(self, session: LearningSession, phase: str, xp: int, next_mode: str = None) -> bool:
+        """Complete a phase exactly once - True for the one caller that should award its XP
+
+        `session` is updated with the stored progress either way.
+        """
+        while True:
+            with self.engine.connect() as conn:
+                payload = conn.execute(
+                    select(StoredSession.payload).where(
+                        StoredSession.session_id == session.session_id,
+                        StoredSession.updated_at > time.time() - self.ttl
+                    )
+                ).scalar()
+            if payload is None:
+                return False
+            state = deserialize_session(payload)
+            if not complete_phase(state, phase, xp, next_mode):
+                copy_progress(session, state)
+                return False
+
+            self.backfill_ref(state)
+            with self.engine.begin() as conn:
+                swapped = conn.execute(
+                    update(StoredSession)
+                    .where(StoredSession.session_id == session.session_id, StoredSession.payload == payload)
+                    .values(payload=serialize_session(state), content_ref=state.content_ref, updated_at=time.time())
+                ).rowcount == 1
+            if swapped:
+                copy_progress(session, state)
+                return True
+            # Another request changed the session in between - look again
+
+    def delete(self, session_id: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(StoredSession).where(StoredSession.session_id == session_id))
+
+    def sweep(self) -> int:
+        """Delete idle rows, then the least recently written rows beyond max_rows"""
+        with self.engine.begin() as conn:
+            expired = conn.execute(
+                delete(StoredSession).where(StoredSession.updated_at <= time.time() - self.ttl)
+            ).rowcount
+            overflow = conn.execute(select(func.count()).select_from(StoredSession)).scalar() - self.max_rows
+            evicted = 0
+            if overflow > 0:
+                stale = select(StoredSession.session_id).order_by(StoredSession.updated_at).limit(overflow)
+                evicted = conn.execute(
+                    delete(StoredSession).where(StoredSession.session_id.in_(stale))
+                ).rowcount
+        self.expirations += expired
+        self.evictions += evicted
+        return expired + evicted
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "entries": len(self),
+            "max_entries": self.max_rows,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(StoredSession)).scalar()
+
+
+class StoreSweeper:
+    """Background task that sweeps idle entries out of the stores every `interval` seconds"""
+
+    def __init__(self, stores: List, interval: float = 60.0):
+        self.stores = stores
+        self.interval = interval
+        self.sweeps = 0
+        self.swept = 0
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"interval": self.interval, "sweeps": self.sweeps, "swept": self.swept}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            for store in self.stores:
+                try:
+                    # SQLite deletes can block - keep them off the event loop
+                    self.swept += await asyncio.to_thread(store.sweep)
+                except Exception as e:
+                    print(f"[SESSIONS] Sweep failed for {type(store).__name__}: {type(e).__name__}: {e}")
+            self.sweeps += 1
+
+
+SESSION_STORES = {
+    "memory": MemorySessionStore,
+    "sqlite": SqliteSessionStore,
+}
+
+
+def create_session_store():
+    """Store picked by SESSION_STORE (default: sqlite, safe with several workers)"""
+    backend = os.getenv("SESSION_STORE", "sqlite").lower()
+    if backend not in SESSION_STORES:
+        raise ValueError(f"Unknown SESSION_STORE '{backend}' (expected one of: {', '.join(SESSION_STORES)})")
+    return SESSION_STORES[backend](
+        int(os.getenv("SESSION_MAX_ENTRIES", "10000" if backend == "memory" else "100000")),
+        ttl=float(os.getenv("SESSION_TTL", str(2 * 3600))),
+    )
@@ -0,0 +1,47 @@
+"""Single-flight - coalesce concurrent identical async calls into one"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """Share one in-flight call per key between all concurrent callers
+    
+    The first caller for a key starts the work; everyone arriving while it
+    runs awaits the same task. The task is shielded so a caller that gives
+    up (e.g. client disconnect) doesn't cancel it for the others.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task, _ = self.task(key, fn)
+        return await asyncio.shield(task)
+    
+    def task(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[asyncio.Future, bool]:
+        """The in-flight task for a key, starting fn() if there is none - (task, whether this call started it)
+        
+        Await the task through asyncio.shield, as do() does.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task, False
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        self.started += 1
+        return task, True
+    
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running"""
+        return len(self._calls)
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight(),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
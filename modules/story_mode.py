@@ -1,18 +1,9 @@
 """Story Mode - Generate engaging narrative from a topic"""
-import os
 import json
 import re
-from dotenv import load_dotenv
-from openai import OpenAI
+from modules.llm_clients import get_client
 from gamification.models import Story
 
-# Load environment variables and configure OpenRouter
-load_dotenv()
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY")
-)
-
 MODEL = "google/gemini-2.0-flash-exp:free"
 
 def generate_story(topic: str) -> Story:
@@ -29,7 +20,7 @@ IMPORTANT: Return ONLY valid JSON in this exact format, nothing else:
 {{"title": "Story Title", "content": "Full story text here...", "key_facts": ["fact 1", "fact 2", "fact 3", "fact 4", "fact 5"]}}"""
 
     try:
-        response = client.chat.completions.create(
+        response = get_client().chat.completions.create(
             model=MODEL,
             messages=[{"role": "user", "content": prompt}]
         )
@@ -0,0 +1,297 @@
+"""Stream Parser - incremental parsing of streamed AI responses into content models"""
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+from gamification.models import Story, Quiz, QuizQuestion, MasterPractice, MasterQuestion, DetectiveCase, Clue
+
+SECTIONS = ("story", "quiz", "master", "detective")
+
+# Per-section limits, same as the prompt asks for
+MAX_QUIZ_QUESTIONS = 5
+MAX_MASTER_QUESTIONS = 3
+MAX_CLUES = 4
+
+# Parser tokens: a whole string (possibly cut off at the end of the buffer)
+# or a single structural character. Everything else is skipped in C.
+TOKENS = re.compile(r'"(?:[^"\\]|\\.)*(?P<end>"|\\?\Z)|[{}\[\]:,]')
+# The remainder of a string that was cut off by the previous chunk
+STRING_REST = re.compile(r'(?:[^"\\]|\\.)*(?P<end>"|\\?\Z)')
+
+
+def loads_lenient(text: str) -> Any:
+    """json.loads that forgives trailing commas and raw newlines/tabs inside strings (common model mistakes)"""
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        text = re.sub(r',\s*}', '}', text)
+        text = re.sub(r',\s*]', ']', text)
+        return json.loads(text, strict=False)
+
+
+# ==================== Model Builders ====================
+
+def build_story(story_data: dict, topic: str) -> Story:
+    """Build the Story model from the "story" section of an AI response"""
+    return Story(
+        topic=topic,
+        title=story_data.get("title", f"Learning About {topic}"),
+        content=story_data.get("content", f"An amazing journey into {topic}..."),
+        key_facts=story_data.get("key_facts", [f"{topic} is fascinating"])[:5],
+        xp_reward=15
+    )
+
+
+def build_quiz_question(q: dict) -> QuizQuestion:
+    return QuizQuestion(
+        question=q.get("question", "Question"),
+        options=q.get("options", ["A", "B", "C", "D"]),
+        correct_index=q.get("correct_index", 0),
+        explanation=q.get("explanation", "Correct!")
+    )
+
+
+def build_master_question(q: dict) -> MasterQuestion:
+    return MasterQuestion(
+        question=q.get("question", "Advanced question"),
+        question_type="multiple_choice",
+        options=q.get("options", ["A", "B", "C", "D"]),
+        correct_answer=q.get("correct_answer", "A"),
+        explanation=q.get("explanation", "Correct!"),
+        xp_reward=20
+    )
+
+
+def build_clue(c: dict, index: int) -> Clue:
+    return Clue(id=c.get("id", index + 1), description=c.get("description", "Clue"), is_key_clue=True)
+
+
+def make_quiz(questions: List[QuizQuestion], topic: str) -> Quiz | None:
+    """Wrap quiz questions into a Quiz - None if there are none"""
+    if not questions:
+        return None
+    return Quiz(
+        topic=topic,
+        questions=questions,
+        difficulty="basic",
+        total_xp=len(questions) * 10 + 20
+    )
+
+
+def make_master(questions: List[MasterQuestion], topic: str) -> MasterPractice | None:
+    """Wrap master questions into a MasterPractice - None if there are none"""
+    if not questions:
+        return None
+    return MasterPractice(
+        topic=topic,
+        questions=questions,
+        total_xp=len(questions) * 20 + 50
+    )
+
+
+def build_quiz(quiz_data: dict, topic: str) -> Quiz | None:
+    """Build the Quiz model from the "quiz" section - None if it has no questions"""
+    questions = [build_quiz_question(q) for q in quiz_data.get("questions", [])[:MAX_QUIZ_QUESTIONS]]
+    return make_quiz(questions, topic)
+
+
+def build_master(master_data: dict, topic: str) -> MasterPractice | None:
+    """Build the MasterPractice model from the "master" section - None if empty"""
+    questions = [build_master_question(q) for q in master_data.get("questions", [])[:MAX_MASTER_QUESTIONS]]
+    return make_master(questions, topic)
+
+
+def build_detective(det_data: dict, topic: str) -> DetectiveCase | None:
+    """Build the DetectiveCase model from the "detective" section - None without clues"""
+    clues = [build_clue(c, i) for i, c in enumerate(det_data.get("clues", [])[:MAX_CLUES])]
+
+    if not clues:
+        return None
+
+    options = det_data.get("options", [])
+    question = det_data.get("question", "Solve the mystery")
+    if options:
+        question += "\n\n" + "\n".join([f"{chr(65+i)}. {opt}" for i, opt in enumerate(options[:4])])
+
+    return DetectiveCase(
+        topic=topic,
+        case_title=det_data.get("case_title", f"The {topic} Mystery"),
+        scenario=det_data.get("scenario", f"A mystery about {topic} awaits..."),
+        clues=clues,
+        question=question,
+        correct_answer=det_data.get("correct_answer", "A"),
+        explanation=det_data.get("explanation", "Great detective work!"),
+        xp_reward=100
+    )
+
+
+# ==================== Incremental Parser ====================
+
+class _Frame:
+    """One open JSON object/array on the parser stack"""
+    __slots__ = ("is_object", "start", "path", "key", "index", "last_string")
+
+    def __init__(self, is_object: bool, start: int, path: tuple):
+        self.is_object = is_object
+        self.start = start
+        self.path = path
+        self.key = None          # Current key (objects)
+        self.index = 0           # Current item index (arrays)
+        self.last_string = None  # Last string seen, becomes the key on ':'
+
+    def child_path(self) -> tuple:
+        return self.path + ((self.key if self.is_object else self.index),)
+
+
+class ContentStreamParser:
+    """Incrementally parse a unified AI response into content models
+
+    Feed raw model output chunk by chunk; each feed() returns the events
+    completed by that chunk, as (kind, model) pairs:
+
+        ("story", Story)
+        ("quiz_question", QuizQuestion) ... then ("quiz", Quiz)
+        ("master_question", MasterQuestion) ... then ("master", MasterPractice)
+        ("clue", Clue) ... then ("detective", DetectiveCase)
+
+    Strings are skipped whole by the regex engine so only structural
+    characters reach Python, and only the small slice of each finished item
+    is handed to json.loads. Text before the first '{' (prose,
+    ```json fences) and after the root object closes is ignored. Items that
+    fail to decode or validate are skipped rather than failing the response.
+    """
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.text = ""
+        self.done = False
+        self.story: Optional[Story] = None
+        self.quiz: Optional[Quiz] = None
+        self.master: Optional[MasterPractice] = None
+        self.detective: Optional[DetectiveCase] = None
+        self.quiz_questions: List[QuizQuestion] = []
+        self.master_questions: List[MasterQuestion] = []
+        self.clues: List[Clue] = []
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._open_string = None  # Start of a string still being streamed
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        if self.done or not chunk:
+            return []
+        self.text += chunk
+        text = self.text
+        events = []
+        stack = self._stack
+
+        if not stack:
+            # Skip prose and code fences up to the root object
+            root = text.find("{", self._pos)
+            if root == -1:
+                self._pos = len(text)
+                return events
+            stack.append(_Frame(True, root, ()))
+            self._pos = root + 1
+
+        pos = self._pos
+        if self._open_string is not None:
+            # Finish the string the last chunk ended inside of
+            rest = STRING_REST.match(text, pos)
+            if rest.group("end") != '"':
+                self._pos = rest.start("end")
+                return events
+            if stack[-1].is_object:
+                stack[-1].last_string = text[self._open_string + 1:rest.end() - 1]
+            self._open_string = None
+            pos = rest.end()
+
+        resume = len(text)
+        for match in TOKENS.finditer(text, pos):
+            token = match.group()
+            top = stack[-1]
+
+            if token[0] == '"':
+                if match.group("end") != '"':
+                    # String cut off by the chunk boundary - continue it next time
+                    self._open_string = match.start()
+                    resume = match.start("end")
+                    break
+                if top.is_object:
+                    top.last_string = token[1:-1]
+            elif token == ":":
+                if top.is_object:
+                    top.key = top.last_string
+            elif token == ",":
+                if top.is_object:
+                    top.last_string = None
+                else:
+                    top.index += 1
+            elif token == "{" or token == "[":
+                stack.append(_Frame(token == "{", match.start(), top.child_path()))
+            else:
+                frame = stack.pop()
+                if not stack:
+                    self.done = True
+                    break
+                self._close(frame, text[frame.start:match.end()], events)
+
+        self._pos = resume
+        return events
+
+    def _close(self, frame: _Frame, raw: str, events: list) -> None:
+        """Turn a finished container into models, if it's one we care about"""
+        path = frame.path
+        section = path[0]
+        depth = len(path)
+        try:
+            if depth == 1:
+                if section == "story" and frame.is_object:
+                    story_data = loads_lenient(raw)
+                    if not story_data.get("content"):
+                        raise ValueError("story has no content")
+                    self.story = build_story(story_data, self.topic)
+                    events.append(("story", self.story))
+                elif section == "quiz":
+                    self.quiz = make_quiz(self.quiz_questions, self.topic)
+                    if self.quiz:
+                        events.append(("quiz", self.quiz))
+                elif section == "master":
+                    self.master = make_master(self.master_questions, self.topic)
+                    if self.master:
+                        events.append(("master", self.master))
+                elif section == "detective" and frame.is_object:
+                    self.detective = build_detective(loads_lenient(raw), self.topic)
+                    if self.detective:
+                        events.append(("detective", self.detective))
+
+            elif depth == 3 and frame.is_object and isinstance(path[2], int):
+                field, index = path[1], path[2]
+                if section == "quiz" and field == "questions" and index < MAX_QUIZ_QUESTIONS:
+                    question = build_quiz_question(loads_lenient(raw))
+                    self.quiz_questions.append(question)
+                    events.append(("quiz_question", question))
+                elif section == "master" and field == "questions" and index < MAX_MASTER_QUESTIONS:
+                    question = build_master_question(loads_lenient(raw))
+                    self.master_questions.append(question)
+                    events.append(("master_question", question))
+                elif section == "detective" and field == "clues" and index < MAX_CLUES:
+                    clue = build_clue(loads_lenient(raw), index)
+                    self.clues.append(clue)
+                    events.append(("clue", clue))
+
+        except Exception as e:
+            print(f"[PARSE] Skipping {'.'.join(map(str, path))}: {type(e).__name__}: {e}")
+
+    def result(self) -> dict | None:
+        """The parsed content once the response is complete - None if a phase is missing or invalid"""
+        if not (self.story and self.quiz and self.master and self.detective):
+            return None
+
+        return {
+            "success": True,
+            "source": "ai",
+            "story": self.story,
+            "quiz": self.quiz,
+            "master": self.master,
+            "detective": self.detective
+        }
@@ -0,0 +1,312 @@
+"""Topic Index - routes custom topics to existing content that already covers them
+
+A small TF-IDF retrieval index over hashed word and character n-gram
+features. Documents are the featured quests (titles, aliases, level
+topics, story titles, key facts and story text) and the cached AI topics
+(topic, story title, key facts). A custom topic that clears the
+similarity threshold reuses that content instead of a 10-60s generation.
+
+Cosine alone routes on shared character n-grams and a single common word
+("world war 2" -> python, "ball python care" -> python), so a match also
+has to contain enough of the topic's words (and, for cached topics, the
+same numbers). The labelled topics in
+test_topic_index.py, negatives included, pin the thresholds down.
+"""
+import os
+import re
+import time
+import zlib
+import threading
+import numpy as np
+from sqlalchemy import select, func
+
+from gamification.database import SessionLocal
+from gamification.models_db import CachedContent
+from modules.content_cache import normalize_topic
+from modules.prebuilt_quests import quest_packs
+
+FEATURE_BITS = 20
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+# Words that say nothing about the subject ("how do black holes form")
+STOPWORDS = frozenset("""
+a about an and are as at basics be beginner beginners by can course do does explain explained for form from
+did go goes guide happen happened happens how i in intro introduction is it learn learning me of on or teach the to
+tutorial understand understanding what when where which who why with work works you your
+""".split())
+
+QUEST_DOC = "quest"
+CACHED_DOC = "cached"
+
+
+def stem(word: str) -> str:
+    """Crude plural folding, enough for whole words to meet ("holes" / "hole", "singularities" / "singularity")"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def words(text: str) -> list:
+    """The subject words of a text, stemmed - numbers always count ("world war 1")"""
+    return [stem(word) for word in re.findall(r"[a-z0-9]+", text.lower())
+            if word not in STOPWORDS and (len(word) >= 2 or word.isdigit())]
+
+
+def numbers(text: str) -> set:
+    return {word for word in words(text) if word.isdigit()}
+
+
+def word_feature(word: str) -> int:
+    return zlib.crc32(("w:" + word).encode()) & FEATURE_MASK
+
+
+def features(text: str) -> dict:
+    """Hashed feature counts: whole (stemmed) words plus space-padded character 3-grams of each word"""
+    counts = {}
+    for word in words(text):
+        grams = ["w:" + word]
+        padded = f" {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        for gram in grams:
+            feature = zlib.crc32(gram.encode()) & FEATURE_MASK
+            counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+def feature_arrays(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """features() as (feature ids, counts) arrays"""
+    counts = features(text)
+    return (np.fromiter(counts, dtype=np.int64, count=len(counts)),
+            np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+
+
+class TopicIndex:
+    """TF-IDF cosine similarity over a few thousand short documents
+
+    Postings are stored feature-major (sorted feature ids with doc ids and
+    weights alongside), so a query only touches the postings of its own
+    ~50 features: one searchsorted and one bincount in NumPy.
+
+    Built on first use. The built arrays are never modified in place -
+    refresh() and add_cached() build new ones and swap them in, so queries
+    don't take the lock.
+    """
+
+    def __init__(self, quest_threshold: float = 0.12, quest_margin: float = 1.8, quest_coverage: float = 0.5,
+                 cached_threshold: float = 0.5, cached_coverage: float = 0.75, max_cached: int = 5000):
+        self.quest_threshold = quest_threshold
+        self.quest_margin = quest_margin
+        self.quest_coverage = quest_coverage
+        self.cached_threshold = cached_threshold
+        self.cached_coverage = cached_coverage
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._quest_docs = []   # (kind, target, text) - rebuilt when the quest pack changes
+        self._quest_version = None
+        self._cached_docs = []
+        self._built = None      # (docs, feature ids, doc ids, weights, idf lookup)
+        self._cached_mark = None
+        self._features = {}     # document text -> (feature ids, counts)
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    # ---- documents ----
+
+    def _load_quest_docs(self, pack) -> list:
+        docs = []
+        for quest_id, info in pack.info.items():
+            parts = [info["title"], info["description"], *pack.aliases.get(quest_id, [])]
+            # Raw records - indexing shouldn't parse (and keep) every level's phase models
+            for level in pack.quests.levels(quest_id):
+                record = pack.quests.record(quest_id, level)
+                story = record["story"]
+                parts.extend([record["topic"], story["title"], *story["key_facts"], story["content"]])
+            docs.append((QUEST_DOC, quest_id, " ".join(parts)))
+        return docs
+
+    def _load_cached_docs(self) -> tuple[list, tuple]:
+        """Fresh cached AI topics with their story title and key facts (read in SQL, no model parsing)"""
+        now = time.time()
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(CachedContent.topic,
+                       func.json_extract(CachedContent.payload, "$.story.title"),
+                       func.json_extract(CachedContent.payload, "$.story.key_facts"))
+                .where(CachedContent.expires_at > now)
+                .order_by(CachedContent.last_used_at.desc())
+                .limit(self.max_cached)
+            ).all()
+            mark = db.execute(
+                select(func.count(), func.max(CachedContent.created_at)).where(CachedContent.expires_at > now)
+            ).one()
+        finally:
+            db.close()
+        docs = [(CACHED_DOC, topic, " ".join(filter(None, [topic, topic, title, facts]))) for topic, title, facts in rows]
+        return docs, tuple(mark)
+
+    # ---- build / refresh ----
+
+    def _build(self, docs: list) -> tuple:
+        # Feature arrays are memoized per document text - a rebuild only hashes new documents
+        known = self._features
+        doc_features = [known.get(text) or feature_arrays(text) for _, _, text in docs]
+        self._features = {text: arrays for (_, _, text), arrays in zip(docs, doc_features)}
+
+        lengths = np.fromiter((len(keys) for keys, _ in doc_features), dtype=np.int64, count=len(docs))
+        feature_ids = np.concatenate([keys for keys, _ in doc_features]) if docs else np.zeros(0, np.int64)
+        counts = np.concatenate([counts for _, counts in doc_features]) if docs else np.zeros(0, np.float32)
+        doc_ids = np.repeat(np.arange(len(docs), dtype=np.int32), lengths)
+
+        # One sort serves both the idf counts and the feature-major postings
+        order = np.argsort(feature_ids, kind="stable")
+        feature_ids, doc_ids, counts = feature_ids[order], doc_ids[order], counts[order]
+        first = np.ones(len(feature_ids), dtype=bool)
+        first[1:] = feature_ids[1:] != feature_ids[:-1]
+        unique = feature_ids[first]
+        slot = np.cumsum(first) - 1
+        df = np.bincount(slot, minlength=len(unique))
+
+        # Smoothed idf per distinct feature; sublinear tf; rows L2-normalized
+        idf = (np.log((1 + len(docs)) / (1 + df)) + 1).astype(np.float32)
+        weights = (1 + np.log(counts)) * idf[slot]
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights * weights, minlength=len(docs)))
+        weights = (weights / np.maximum(norms[doc_ids], 1e-12)).astype(np.float32)
+        return docs, feature_ids, doc_ids, weights, (unique, idf)
+
+    def _current(self) -> tuple:
+        if self._built is None or quest_packs.active().version != self._quest_version:
+            self.refresh()
+        return self._built
+
+    def refresh(self) -> int:
+        """Re-read cached topics and the active quest pack if they changed - returns the number of documents"""
+        pack = quest_packs.active()
+        docs, mark = self._load_cached_docs()
+        with self._lock:
+            if self._built is not None and mark == self._cached_mark and pack.version == self._quest_version:
+                return len(self._built[0])
+            if pack.version != self._quest_version:
+                self._quest_docs, self._quest_version = self._load_quest_docs(pack), pack.version
+            built = self._build(self._quest_docs + docs)
+            self._cached_docs, self._cached_mark, self._built = docs, mark, built
+            self.refreshes += 1
+            return len(built[0])
+
+    def sweep(self) -> int:
+        """StoreSweeper hook: pick up topics other workers cached and quest pack swaps, drop expired topics"""
+        self.refresh()
+        return 0
+
+    def add_cached(self, topic: str, content: dict) -> None:
+        """Index content this worker just cached (other workers see it on their next refresh)"""
+        story = content["story"]
+        doc = (CACHED_DOC, topic, " ".join([topic, topic, story.title, *story.key_facts]))
+        self._current()
+        with self._lock:
+            self._cached_docs = [d for d in self._cached_docs if d[1] != topic][-(self.max_cached - 1):] + [doc]
+            self._built = self._build(self._quest_docs + self._cached_docs)
+
+    # ---- queries ----
+
+    def scores(self, topic: str) -> tuple[list, np.ndarray]:
+        """(documents, cosine similarity of each to the topic)"""
+        docs, feature_ids, doc_ids, weights, (unique, idf) = self._current()
+        keys, tf = feature_arrays(topic)
+        scores = np.zeros(len(docs), dtype=np.float32)
+        if not len(keys) or not len(docs):
+            return docs, scores
+
+        tf = 1 + np.log(tf)
+        slot = np.searchsorted(unique, keys)
+        known = (slot < len(unique)) & (unique[np.minimum(slot, len(unique) - 1)] == keys)
+        keys, q = keys[known], tf[known] * idf[slot[known]]
+        if not len(keys):
+            return docs, scores
+        q /= np.linalg.norm(q)
+
+        starts = np.searchsorted(feature_ids, keys, side="left")
+        ends = np.searchsorted(feature_ids, keys, side="right")
+        lengths = ends - starts
+        postings = np.repeat(ends - lengths.cumsum(), lengths) + np.arange(lengths.sum())
+        contributions = weights[postings] * np.repeat(q, lengths)
+        return docs, np.bincount(doc_ids[postings], weights=contributions, minlength=len(docs))
+
+    def coverage(self, topic: str, text: str) -> float:
+        """Share of the topic's words that appear in a document's text"""
+        wanted = {word_feature(word) for word in words(topic)}
+        if not wanted:
+            return 0.0
+        keys = (self._features.get(text) or feature_arrays(text))[0]
+        found = np.isin(np.fromiter(wanted, dtype=np.int64, count=len(wanted)), keys)
+        return float(found.mean())
+
+    def match(self, topic: str) -> tuple[str, str, float] | None:
+        """(kind, target, score) of content close enough to stand in for the topic - kind is "quest" or "cached"
+
+        A cached AI topic needs a high cosine similarity, `cached_coverage` of
+        the topic's words in its document and exactly the same numbers:
+        character n-grams alone make "javascript" look like "java",
+        "inorganic chemistry" like "organic chemistry" and "world war 1" like
+        "world war 2". Quest documents are long, so a quest also has
+        to clearly beat the runner-up quest: a topic that sits about as close
+        to two quests ("rust programming" vs Python and AI) isn't covered by
+        either. And it has to contain at least `quest_coverage` of the topic's
+        words - "ball python care" shares only "python" with the Python quest.
+        """
+        docs, scores = self.scores(topic)
+        # Quest documents come first (counted from this build - a pack swap may rebuild meanwhile)
+        quest_count = next((i for i, doc in enumerate(docs) if doc[0] != QUEST_DOC), len(docs))
+        quests, cached = scores[:quest_count], scores[quest_count:]
+
+        found = None
+        if len(cached):
+            best = quest_count + int(cached.argmax())
+            score = float(scores[best])
+            _, target, text = docs[best]
+            if (score >= self.cached_threshold and normalize_topic(target) != normalize_topic(topic)
+                    and numbers(target) == numbers(topic)
+                    and self.coverage(topic, text) >= self.cached_coverage):
+                found = (CACHED_DOC, target, score)
+        if found is None and quest_count:
+            ranked = np.argsort(quests)[::-1]
+            score = float(quests[ranked[0]])
+            runner_up = float(quests[ranked[1]]) if quest_count > 1 else 0.0
+            if (score >= self.quest_threshold and score >= self.quest_margin * runner_up
+                    and self.coverage(topic, docs[ranked[0]][2]) >= self.quest_coverage):
+                found = (QUEST_DOC, docs[ranked[0]][1], score)
+
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "documents": len(self._built[0]) if self._built else 0,
+            "quest_pack": self._quest_version,
+            "quest_threshold": self.quest_threshold,
+            "quest_margin": self.quest_margin,
+            "quest_coverage": self.quest_coverage,
+            "cached_threshold": self.cached_threshold,
+            "cached_coverage": self.cached_coverage,
+            "refreshes": self.refreshes,
+        }
+
+
+topic_index = TopicIndex(
+    quest_threshold=float(os.getenv("TOPIC_QUEST_THRESHOLD", "0.12")),
+    quest_margin=float(os.getenv("TOPIC_QUEST_MARGIN", "1.8")),
+    quest_coverage=float(os.getenv("TOPIC_QUEST_COVERAGE", "0.5")),
+    cached_threshold=float(os.getenv("TOPIC_CACHED_THRESHOLD", "0.5")),
+    cached_coverage=float(os.getenv("TOPIC_CACHED_COVERAGE", "0.75")),
+    max_cached=int(os.getenv("TOPIC_INDEX_MAX_CACHED", "5000")),
+)
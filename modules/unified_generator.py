@@ -1,21 +1,24 @@
 """Unified Learning Generator - Hybrid content with multi-model fallback"""
 import os
-import json
-import re
 import time
+import asyncio
 import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
-from gamification.models import Story, Quiz, QuizQuestion, MasterPractice, MasterQuestion, DetectiveCase, Clue
-from modules.prebuilt_quests import is_featured_quest, get_featured_quest
+from openai import OpenAI, AsyncOpenAI, APITimeoutError, APIStatusError
+from modules import llm_clients
+from modules.prebuilt_quests import quest_packs, is_featured_quest, get_featured_quest, split_level
+from modules.content_cache import content_cache, normalize_topic
+from modules.content_store import quest_ref
+from modules.topic_index import topic_index, QUEST_DOC
+from modules.singleflight import SingleFlight
+from modules.stream_parser import ContentStreamParser, SECTIONS
+from modules import model_router as router
+from modules.pregenerator import Pregenerator, TopicTrends, GenerationLeases
+from modules.level_prefetch import LevelPrefetcher, next_level_topic
+from modules.phase_payloads import PHASE_PAYLOADS, payload_cache
 
-# Load environment variables and configure OpenRouter with LONG timeout
+# Load environment variables (clients and their timeouts live in llm_clients)
 load_dotenv()
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-    timeout=httpx.Timeout(60.0, connect=10.0)  # 60 second timeout, 10 second connect
-)
 
 # Models to try in order (free tier - Jan 2026)
 MODELS = [
@@ -24,48 +27,290 @@ MODELS = [
     "meta-llama/llama-3.3-70b-instruct:free",
 ]
 
+# Hedged requests: start the next model if the current ones haven't answered
+# within this many seconds. 0 races every model at once, negative disables
+# hedging (strict one-after-another fallback).
+HEDGE_DELAY = float(os.getenv("AI_HEDGE_DELAY", "8"))
+
+# Concurrent requests for the same (normalized) topic with the same API key share one generation
+inflight_generations = SingleFlight()
+
+
+def flight_key(topic: str, user_api_key: str = None) -> tuple:
+    """Single-flight key: the topic and the API key the generation would use
+    
+    Without a server key, a caller with a bad personal key must not hand its
+    failure to callers whose key works.
+    """
+    return normalize_topic(topic), resolve_api_key(user_api_key)
+
+# Tracks model health and decides which model goes first
+model_router = router.create_router(MODELS)
+
+
+# 4xx statuses that are about the model rather than the request or its key:
+# model gone, upstream timeout, model rate-limited
+MODEL_STATUS_CODES = {404, 408, 429}
+
+def error_outcome(e: Exception) -> str:
+    """Classify a failed model call for the router
+
+    Other 4xx responses (401 bad key, 402 out of credits, 403, 400 bad
+    request) are refusals of the request or its API key - often a user's
+    own key - so they are kept out of the shared model health.
+    """
+    if isinstance(e, (httpx.TimeoutException, APITimeoutError)):
+        return router.TIMEOUT
+    if isinstance(e, APIStatusError) and 400 <= e.status_code < 500 and e.status_code not in MODEL_STATUS_CODES:
+        return router.CLIENT_ERROR
+    return router.ERROR
+
+def get_prebuilt_content(topic: str) -> dict | None:
+    """Return pre-built quest content if the topic matches a featured quest"""
+    version = quest_packs.active().version  # Match and load from the same pack
+    featured_match = is_featured_quest(topic, version)
+    if not featured_match:
+        return None
+    
+    quest_id, level = featured_match
+    content = prebuilt_content(quest_id, level, f"prebuilt (Level {level})", version)
+    if content is None:
+        print(f"[HYBRID] Pre-built quest {quest_id} has no Level {level} (pack {version})")
+        return None
+    print(f"[HYBRID] Using pre-built quest: {quest_id} (Level {level}, pack {version})")
+    return content
+
+def prebuilt_content(quest_id: str, level: int, source: str, version: str = None) -> dict | None:
+    """A pre-built quest level as session content, pinned to its pack version (the active one if None)"""
+    version = version or quest_packs.active().version
+    quest = get_featured_quest(quest_id, level, version)
+    if quest is None:
+        return None
+    return {
+        "success": True,
+        "source": source,
+        "content_ref": quest_ref(quest_id, level, version),
+        "story": quest["story"],
+        "quiz": quest["quiz"],
+        "master": quest["master"],
+        "detective": quest["detective"]
+    }
+
+def get_similar_content(topic: str) -> dict | None:
+    """Existing content that covers a custom topic closely enough (see topic_index) - saves a generation"""
+    base_topic, level = split_level(topic)
+    match = topic_index.match(base_topic)
+    if not match:
+        return None
+    
+    kind, target, score = match
+    if kind == QUEST_DOC:
+        content = prebuilt_content(target, level, f"prebuilt (Level {level}, similar topic)")
+        if content:
+            print(f"[SIMILAR] '{topic}' -> pre-built quest {target} (Level {level}, score {score:.2f})")
+        return content
+    
+    if split_level(target)[1] != level:
+        return None  # Another level of the same topic - it would repeat what the user already did
+    content = content_cache.get(target)
+    if content is None:
+        return None  # Expired since the index last refreshed
+    print(f"[SIMILAR] '{topic}' -> cached '{target}' (score {score:.2f})")
+    content["source"] = "cache (similar topic)"
+    return content
+
+def find_existing_content(topic: str, count: bool = True) -> dict | None:
+    """Pre-built, cached or similar content for a topic - None if it has to be generated
+    
+    Custom topics are counted for the pre-generator (unless `count` is False,
+    for background lookups), except those routed to similar content - it
+    shouldn't spend generations on topics we cover.
+    """
+    prebuilt = get_prebuilt_content(topic)
+    if prebuilt:
+        return prebuilt
+    
+    cached = content_cache.get(topic)
+    if cached:
+        if count:
+            topic_trends.record(topic)
+        print(f"[CACHE] Hit for: {topic}")
+        return cached
+    
+    similar = get_similar_content(topic)
+    if similar:
+        return similar
+    
+    if count:
+        topic_trends.record(topic)
+    return None
+
+def cache_content(topic: str, content: dict) -> None:
+    """Cache generated content and make it routable for similar topics"""
+    content_cache.put(topic, content)
+    topic_index.add_cached(topic, content)
+
+
 def generate_all_content(topic: str, user_api_key: str = None) -> dict:
     """Generate all learning content - uses pre-built quests or AI with fallback"""
     
     # Check if this matches a featured quest
-    featured_match = is_featured_quest(topic)
-    if featured_match:
-        quest_id, level = featured_match
-        print(f"[HYBRID] Using pre-built quest: {quest_id} (Level {level})")
-        quest = get_featured_quest(quest_id, level)
-        return {
-            "success": True,
-            "source": f"prebuilt (Level {level})",
-            "story": quest["story"],
-            "quiz": quest["quiz"],
-            "master": quest["master"],
-            "detective": quest["detective"]
-        }
+    prebuilt = get_prebuilt_content(topic)
+    if prebuilt:
+        return prebuilt
+    
+    # Someone already generated this topic recently
+    cached = content_cache.get(topic)
+    if cached:
+        print(f"[CACHE] Hit for: {topic}")
+        return cached
+    
+    # Or something close enough to it
+    similar = get_similar_content(topic)
+    if similar:
+        return similar
     
     # Try AI generation with multiple models
-    return generate_with_fallback(topic, user_api_key)
+    result = generate_with_fallback(topic, user_api_key)
+    if result.get("success"):
+        cache_content(topic, result)
+    return result
 
 
-def get_client(user_api_key: str = None):
-    """Get OpenAI client - tries server key first, then user key"""
-    # Try server key first (for judges), then user key as fallback
-    server_key = os.getenv("OPENROUTER_API_KEY")
-    api_key = server_key or user_api_key
+async def generate_all_content_async(topic: str, user_api_key: str = None) -> dict:
+    """Async version of generate_all_content - never blocks the event loop"""
+    # Cache and content lookups hit SQLite - keep them off the event loop
+    existing = await asyncio.to_thread(find_existing_content, topic)
+    if existing:
+        return existing
     
-    if not api_key:
-        return None
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-        timeout=httpx.Timeout(60.0, connect=10.0)
+    if not resolve_api_key(user_api_key):
+        return dict(NO_API_KEY_ERROR)
+    
+    async def generate_and_cache():
+        result = await generate_with_fallback_async(topic, user_api_key)
+        if result.get("success"):
+            # Re-indexing takes ~100ms with thousands of cached topics - keep it off the event loop
+            await asyncio.to_thread(cache_content, topic, result)
+        return result
+    
+    # Each caller gets its own dict; the content models are shared read-only
+    result = await inflight_generations.do(flight_key(topic, user_api_key), generate_and_cache)
+    return dict(result)
+
+
+async def pregenerate_topic(topic: str) -> dict:
+    """Background generation with the server key - interactive callers can join it"""
+    return await inflight_generations.do(
+        flight_key(topic),
+        lambda: generate_with_fallback_async(topic)
     )
 
 
-def generate_with_fallback(topic: str, user_api_key: str = None) -> dict:
-    """Try multiple models, fall back if one fails"""
+# Counts custom-topic requests (across workers); the pre-generator warms the cache for hot ones
+topic_trends = TopicTrends(window=float(os.getenv("PREGEN_WINDOW", "3600")))
+# Budget for background generations, shared by all workers
+pregen_leases = GenerationLeases(
+    concurrency=int(os.getenv("PREGEN_CONCURRENCY", "1")),
+    rate_per_minute=float(os.getenv("PREGEN_RATE_PER_MINUTE", "4")),
+    ttl=float(os.getenv("PREGEN_LEASE_TTL", "900")),
+)
+pregenerator = Pregenerator(
+    generate=pregenerate_topic,
+    store=cache_content,
+    cache=content_cache,
+    trends=topic_trends,
+    leases=pregen_leases,
+    interactive_in_flight=inflight_generations.in_flight,
+    threshold=int(os.getenv("PREGEN_THRESHOLD", "3")),
+    interval=float(os.getenv("PREGEN_INTERVAL", "30")),
+    refresh_ahead=float(os.getenv("PREGEN_REFRESH_AHEAD", str(6 * 3600))),
+)
+
+
+# Custom topics go up to this level (maxLevel in static/js/app.js); featured quests to their max_level
+CUSTOM_MAX_LEVEL = 3
+
+
+def warm_payloads(content: dict) -> None:
+    """Encode a content bundle's phase payloads ahead of its first response"""
+    for phase in PHASE_PAYLOADS:
+        payload_cache.get(content["content_ref"], phase, content[phase])
+
+
+async def prepare_level(topic: str, key_facts: list) -> str:
+    """LevelPrefetcher work: existing content for the level, or one generated from the previous level's key facts
+    
+    Looks the level up exactly as the interactive request will (pre-built,
+    cached, then similar content), so it never generates a level that would
+    have been served from existing content. Generation uses the server key
+    and joins/feeds the same single-flight and cache as interactive requests,
+    so a user who gets there first waits on this generation instead of
+    starting another.
+    """
+    existing = await asyncio.to_thread(find_existing_content, topic, False)
+    if existing:
+        if existing.get("content_ref"):
+            # Pre-built: only the encoded payloads are left to do (cached content gets its ref at session start)
+            await asyncio.to_thread(warm_payloads, existing)
+        source = existing.get("source", "")
+        if "similar" in source:
+            return "similar"
+        return "prebuilt" if source.startswith("prebuilt") else "cached"
+    
+    if not resolve_api_key():
+        return "no_api_key"
     
-    prompt = f"""Create a complete learning experience about: {topic}
+    async def generate_and_cache():
+        result = await generate_with_fallback_async(topic, key_facts=key_facts)
+        if result.get("success"):
+            await asyncio.to_thread(cache_content, topic, result)
+        return result
+    
+    result = await inflight_generations.do(flight_key(topic), generate_and_cache)
+    return "generated" if result.get("success") else "failed"
+
+
+level_prefetcher = LevelPrefetcher(
+    prepare=prepare_level,
+    max_in_flight=int(os.getenv("LEVEL_PREFETCH_MAX_IN_FLIGHT", "2")),
+)
+
+
+def prefetch_next_level(topic: str, key_facts: list) -> bool:
+    """Start preparing the level after a session's topic, if there is one - call as the user nears its end"""
+    pack = quest_packs.active()
+    featured_match = is_featured_quest(topic, pack.version)
+    if featured_match:
+        quest_id, level = featured_match
+        max_level = pack.info[quest_id]["max_level"]
+    else:
+        level, max_level = split_level(topic)[1], CUSTOM_MAX_LEVEL
+    if level >= max_level:
+        return False
+    return level_prefetcher.prefetch(next_level_topic(topic, level + 1), key_facts)
+
+
+def resolve_api_key(user_api_key: str = None) -> str | None:
+    """Pick the API key to use - server key first (for judges), then user key"""
+    return os.getenv("OPENROUTER_API_KEY") or user_api_key
 
+
+def build_prompt(topic: str, key_facts: list = None) -> str:
+    """Build the unified prompt that asks for all four phases in one response
+    
+    key_facts: what the previous level taught, for a next level that builds on it
+    """
+    previous = ""
+    if key_facts:
+        facts = "\n".join(f"- {fact}" for fact in key_facts)
+        previous = f"""
+The learner just finished the previous level, which taught:
+{facts}
+Build on these: go deeper and further, and don't repeat them.
+"""
+    return f"""Create a complete learning experience about: {topic}
+{previous}
 Generate ALL of the following in ONE JSON response:
 
 1. STORY: An engaging educational narrative (200-300 words)
@@ -101,17 +346,44 @@ Return ONLY valid JSON in this exact format:
   }}
 }}"""
 
-    # Get client with user or server API key
-    api_client = get_client(user_api_key)
-    if not api_client:
-        return {
-            "error": True,
-            "message": "No API key available. Please enter your OpenRouter API key for custom topics, or try a Featured Quest!"
-        }
 
-    for i, model in enumerate(MODELS):
+NO_API_KEY_ERROR = {
+    "error": True,
+    "message": "No API key available. Please enter your OpenRouter API key for custom topics, or try a Featured Quest!"
+}
+
+ALL_MODELS_FAILED_ERROR = {
+    "error": True,
+    "message": "AI generation unavailable. Please try one of our Featured Quests instead! 🎮"
+}
+
+
+def generate_with_fallback(topic: str, user_api_key: str = None) -> dict:
+    """Try multiple models, fall back if one fails"""
+    
+    prompt = build_prompt(topic)
+
+    # Pooled client for the user or server API key, held until we're done with it
+    api_key = resolve_api_key(user_api_key)
+    if not api_key:
+        return dict(NO_API_KEY_ERROR)
+
+    with llm_clients.client_pool.lease("sync", api_key) as api_client:
+        result = sequential_models(api_client, model_router.ordered_models(), prompt, topic)
+    if result:
+        return result
+    
+    # All models failed, return friendly error
+    print(f"[AI] All models failed for: {topic}")
+    return dict(ALL_MODELS_FAILED_ERROR)
+
+
+def sequential_models(api_client: OpenAI, models: list, prompt: str, topic: str) -> dict | None:
+    """Try models one after another on the sync client - None if all fail"""
+    for i, model in enumerate(models):
+        started = time.monotonic()
         try:
-            print(f"[AI] Trying model {i+1}/{len(MODELS)}: {model}")
+            print(f"[AI] Trying model {i+1}/{len(models)}: {model}")
             
             response = api_client.chat.completions.create(
                 model=model,
@@ -121,149 +393,346 @@ Return ONLY valid JSON in this exact format:
             
             if not response or not response.choices:
                 print(f"[AI] Model {model} returned empty response")
+                model_router.record(model, router.ERROR)
                 continue
             
             text = response.choices[0].message.content
             if not text:
+                model_router.record(model, router.ERROR)
                 continue
             
             # Parse the response
             result = parse_ai_response(text, topic)
             if result:
                 print(f"[AI] Success with model: {model}")
+                model_router.record(model, router.SUCCESS, time.monotonic() - started)
                 return result
+            model_router.record(model, router.PARSE_FAILURE)
                 
-        except httpx.TimeoutException:
-            print(f"[AI] Model {model} timed out (60s)")
-            continue
         except Exception as e:
             print(f"[AI] Model {model} failed: {type(e).__name__}: {e}")
+            model_router.record(model, error_outcome(e))
             continue
-    
-    # All models failed, return friendly error
-    print(f"[AI] All models failed for: {topic}")
-    return {
-        "error": True,
-        "message": "AI generation unavailable. Please try one of our Featured Quests instead! 🎮"
-    }
+    return None
 
 
-
-def parse_ai_response(text: str, topic: str) -> dict | None:
-    """Parse AI response into structured content"""
+async def try_model_async(api_client: AsyncOpenAI, model: str, prompt: str, topic: str) -> dict | None:
+    """Run one model and parse its response - returns None on any failure"""
+    started = time.monotonic()
+    outcome = router.CANCELLED
     try:
-        text = text.strip()
-        
-        # Remove markdown code blocks
-        if "```" in text:
-            text = re.sub(r'```json?\s*', '', text)
-            text = re.sub(r'```', '', text)
-        
-        # Extract JSON with improved regex to handle multiple braces or extra text
-        # Finds the first '{' and the last '}'
-        start_idx = text.find('{')
-        end_idx = text.rfind('}')
-        
-        if start_idx != -1 and end_idx != -1:
-            text = text[start_idx:end_idx+1]
-
-        try:
-            data = json.loads(text)
-        except json.JSONDecodeError:
-            # Fallback: try to clean common issues like trailing commas
-            text = re.sub(r',\s*}', '}', text)
-            text = re.sub(r',\s*]', ']', text)
-            data = json.loads(text)
-        
-        # Parse Story
-        story_data = data.get("story", {})
-        story = Story(
-            topic=topic,
-            title=story_data.get("title", f"Learning About {topic}"),
-            content=story_data.get("content", f"An amazing journey into {topic}..."),
-            key_facts=story_data.get("key_facts", [f"{topic} is fascinating"])[:5],
-            xp_reward=15
+        response = await api_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=3000
         )
         
-        # Parse Quiz
-        quiz_data = data.get("quiz", {})
-        quiz_questions = []
-        for q in quiz_data.get("questions", [])[:5]:
-            quiz_questions.append(QuizQuestion(
-                question=q.get("question", "Question"),
-                options=q.get("options", ["A", "B", "C", "D"]),
-                correct_index=q.get("correct_index", 0),
-                explanation=q.get("explanation", "Correct!")
-            ))
-        
-        if not quiz_questions:
-            return None  # Invalid response, try next model
-        
-        quiz = Quiz(
-            topic=topic,
-            questions=quiz_questions,
-            difficulty="basic",
-            total_xp=len(quiz_questions) * 10 + 20
-        )
-        
-        # Parse Master
-        master_data = data.get("master", {})
-        master_questions = []
-        for q in master_data.get("questions", [])[:3]:
-            master_questions.append(MasterQuestion(
-                question=q.get("question", "Advanced question"),
-                question_type="multiple_choice",
-                options=q.get("options", ["A", "B", "C", "D"]),
-                correct_answer=q.get("correct_answer", "A"),
-                explanation=q.get("explanation", "Correct!"),
-                xp_reward=20
-            ))
-        
-        if not master_questions:
+        if not response or not response.choices:
+            print(f"[AI] Model {model} returned empty response")
+            outcome = router.ERROR
             return None
         
-        master = MasterPractice(
-            topic=topic,
-            questions=master_questions,
-            total_xp=len(master_questions) * 20 + 50
-        )
-        
-        # Parse Detective
-        det_data = data.get("detective", {})
-        clues = [Clue(id=c.get("id", i+1), description=c.get("description", "Clue"), is_key_clue=True) 
-                 for i, c in enumerate(det_data.get("clues", [])[:4])]
-        
-        if not clues:
+        text = response.choices[0].message.content
+        if not text:
+            outcome = router.ERROR
             return None
         
-        options = det_data.get("options", [])
-        question = det_data.get("question", "Solve the mystery")
-        if options:
-            question += "\n\n" + "\n".join([f"{chr(65+i)}. {opt}" for i, opt in enumerate(options[:4])])
-        
-        detective = DetectiveCase(
-            topic=topic,
-            case_title=det_data.get("case_title", f"The {topic} Mystery"),
-            scenario=det_data.get("scenario", f"A mystery about {topic} awaits..."),
-            clues=clues,
-            question=question,
-            correct_answer=det_data.get("correct_answer", "A"),
-            explanation=det_data.get("explanation", "Great detective work!"),
-            xp_reward=100
+        result = parse_ai_response(text, topic)
+        outcome = router.SUCCESS if result else router.PARSE_FAILURE
+        return result
+    
+    except Exception as e:
+        print(f"[AI] Model {model} failed: {type(e).__name__}: {e}")
+        outcome = error_outcome(e)
+        return None
+    finally:
+        # Still CANCELLED here means we lost a hedged race
+        model_router.record(model, outcome, time.monotonic() - started)
+
+
+async def generate_with_fallback_async(topic: str, user_api_key: str = None, hedge_delay: float = None,
+                                      key_facts: list = None) -> dict:
+    """Async fallback chain - awaits each model so other requests keep being served"""
+    prompt = build_prompt(topic, key_facts)
+    
+    api_key = resolve_api_key(user_api_key)
+    if not api_key:
+        return dict(NO_API_KEY_ERROR)
+    
+    if hedge_delay is None:
+        hedge_delay = HEDGE_DELAY
+    
+    models = model_router.ordered_models()
+    with llm_clients.client_pool.lease("async", api_key) as api_client:
+        if hedge_delay < 0:
+            result = await sequential_models_async(api_client, models, prompt, topic)
+        else:
+            result = await hedged_models_async(api_client, models, prompt, topic, hedge_delay)
+    
+    if result:
+        return result
+    
+    print(f"[AI] All models failed for: {topic}")
+    return dict(ALL_MODELS_FAILED_ERROR)
+
+
+async def sequential_models_async(api_client: AsyncOpenAI, models: list, prompt: str, topic: str) -> dict | None:
+    """Try models strictly one after another"""
+    for i, model in enumerate(models):
+        print(f"[AI] Trying model {i+1}/{len(models)}: {model}")
+        result = await try_model_async(api_client, model, prompt, topic)
+        if result:
+            print(f"[AI] Success with model: {model}")
+            return result
+    return None
+
+
+async def hedged_models_async(api_client: AsyncOpenAI, models: list, prompt: str, topic: str, hedge_delay: float) -> dict | None:
+    """Race models with staggered starts - first parsed response wins, the rest are cancelled
+    
+    A new model is started whenever `hedge_delay` seconds pass without a winner,
+    or straight away when an in-flight model fails.
+    """
+    tasks = {}
+    pending = set()
+    
+    def launch_next() -> bool:
+        if len(tasks) >= len(models):
+            return False
+        model = models[len(tasks)]
+        print(f"[AI] Starting model {len(tasks)+1}/{len(models)}: {model}")
+        task = asyncio.create_task(try_model_async(api_client, model, prompt, topic))
+        tasks[task] = model
+        pending.add(task)
+        return True
+    
+    launch_next()
+    if hedge_delay == 0:
+        while launch_next():
+            pass
+    
+    try:
+        while pending:
+            timeout = hedge_delay if len(tasks) < len(models) else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            
+            for task in done:
+                result = task.result()
+                if result:
+                    print(f"[AI] Success with model: {tasks[task]}")
+                    return result
+            
+            # Timer fired or a model failed - bring in the next one
+            launch_next()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def stream_model_async(api_client: AsyncOpenAI, model: str, prompt: str, topic: str,
+                             events: asyncio.Queue) -> None:
+    """Stream one model: puts (model, section, value) as each section parses, then (model, "end", content or None)"""
+    parser = ContentStreamParser(topic)
+    started = time.monotonic()
+    outcome = router.CANCELLED
+    result = None
+    try:
+        stream = await api_client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=3000,
+            stream=True
         )
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                
+                for kind, value in parser.feed(delta):
+                    if kind in SECTIONS:
+                        events.put_nowait((model, kind, value))
+                if parser.done:
+                    break
+        finally:
+            await stream.close()  # Also when cancelled - releases the pooled connection
         
-        return {
-            "success": True,
-            "source": "ai",
-            "story": story,
-            "quiz": quiz,
-            "master": master,
-            "detective": detective
-        }
-        
+        result = parser.result()
+        outcome = router.SUCCESS if result else router.PARSE_FAILURE
     except Exception as e:
-        print(f"[PARSE] Error: {type(e).__name__}: {e}")
-        return None
+        print(f"[AI] Model {model} stream failed: {type(e).__name__}: {e}")
+        outcome = error_outcome(e)
+    finally:
+        # Still CANCELLED here means another model's stream won
+        model_router.record(model, outcome, time.monotonic() - started)
+        events.put_nowait((model, "end", result))
+
+
+async def stream_generation_async(topic: str, api_client: AsyncOpenAI, sections: asyncio.Queue,
+                                  hedge_delay: float = None) -> dict:
+    """Hedged streaming generation - forwards the leading model's sections to `sections`, returns the content
+    
+    Models start like hedged_models_async: the next one whenever `hedge_delay`
+    seconds pass without a section, or when a running one fails. The first
+    model to produce a section leads and its sections are forwarded; the
+    others keep running until it completes. If the leader fails, a runner-up
+    takes over: its sections so far are sent again (the frontend re-renders
+    them) and it carries on. Only when no model is left does the generation
+    fail. `sections` gets None once nothing more will come. The content is
+    cached before it's returned.
+    """
+    if hedge_delay is None:
+        hedge_delay = HEDGE_DELAY
+    prompt = build_prompt(topic)
+    models = model_router.ordered_models()
+    events = asyncio.Queue()
+    tasks = {}     # model -> task
+    parsed = {}    # model -> [(section, value)] parsed so far
+    ended = set()
+    leader = None
+    finished = None  # A runner-up's complete content, in case the leader fails
+    
+    def launch_next() -> bool:
+        if len(tasks) >= len(models):
+            return False
+        model = models[len(tasks)]
+        print(f"[AI] Streaming model {len(tasks)+1}/{len(models)}: {model}")
+        tasks[model] = asyncio.create_task(stream_model_async(api_client, model, prompt, topic, events))
+        return True
+    
+    def lead(model: str, replay: list) -> None:
+        nonlocal leader
+        leader = model
+        for item in replay:
+            sections.put_nowait(item)
+    
+    async def succeed(model: str, content: dict) -> dict:
+        print(f"[AI] Success with model: {model}")
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.to_thread(cache_content, topic, content)
+        return content
+    
+    launch_next()
+    if hedge_delay == 0:
+        while launch_next():
+            pass
+    
+    try:
+        while True:
+            hedging = leader is None and hedge_delay >= 0 and len(tasks) < len(models)
+            try:
+                model, kind, value = await asyncio.wait_for(events.get(), hedge_delay if hedging else None)
+            except asyncio.TimeoutError:
+                launch_next()  # Nothing yet - bring in the next model
+                continue
+            
+            if kind != "end":
+                parsed.setdefault(model, []).append((kind, value))
+                if leader is None:
+                    lead(model, [])
+                if model == leader:
+                    sections.put_nowait((kind, value))
+                continue
+            
+            ended.add(model)
+            if value and leader in (None, model):
+                if leader is None:
+                    lead(model, [(section, value[section]) for section in SECTIONS])
+                return await succeed(model, value)
+            if value:
+                finished = (model, value)  # Held back while the leader is still going
+                continue
+            if model != leader:
+                if leader is None and not launch_next() and ended.issuperset(tasks):
+                    break
+                continue
+            
+            # The leader failed - hand over to a runner-up
+            print(f"[AI] Leading model {model} failed, falling back")
+            if finished:
+                fallback, content = finished
+                lead(fallback, [(section, content[section]) for section in SECTIONS])
+                return await succeed(fallback, content)
+            running = [other for other in tasks if other not in ended]
+            if running:
+                lead(running[0], parsed.get(running[0], []))
+            else:
+                leader = None
+                if not launch_next():
+                    break
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        sections.put_nowait(None)
+    
+    print(f"[AI] All models failed for: {topic}")
+    return dict(ALL_MODELS_FAILED_ERROR)
+
+
+async def stream_all_content(topic: str, user_api_key: str = None):
+    """Yield (section, value) pairs as each section of the content becomes ready
+    
+    Sections are "story", "quiz", "master" and "detective", in whatever order
+    the model writes them - a section comes again, replacing the first, if
+    the model that was streaming fails and another one takes over. The
+    stream ends with ("done", content) on success or ("error", message) on
+    failure.
+    
+    Generations go through inflight_generations like generate_all_content_async:
+    a stream that starts one gets the sections as they're generated; a request
+    (streamed or not) for the same topic meanwhile shares it and gets every
+    section once it's done. The generation runs on if its stream disconnects.
+    """
+    content = await asyncio.to_thread(find_existing_content, topic)
+    if content:
+        for section in SECTIONS:
+            yield section, content[section]
+        yield "done", content
+        return
+    
+    api_key = resolve_api_key(user_api_key)
+    if not api_key:
+        yield "error", NO_API_KEY_ERROR["message"]
+        return
+    
+    sections = asyncio.Queue()
+    
+    async def generate() -> dict:
+        # The lease outlives this stream if it disconnects - the generation runs on
+        with llm_clients.client_pool.lease("async", api_key) as api_client:
+            return await stream_generation_async(topic, api_client, sections)
+    
+    task, leading = inflight_generations.task(flight_key(topic, user_api_key), generate)
+    if leading:
+        while (item := await sections.get()) is not None:
+            yield item
+    
+    result = dict(await asyncio.shield(task))
+    if not result.get("success"):
+        yield "error", result.get("message", ALL_MODELS_FAILED_ERROR["message"])
+        return
+    if not leading:
+        for section in SECTIONS:
+            yield section, result[section]
+    yield "done", result
+
+
+def parse_ai_response(text: str, topic: str) -> dict | None:
+    """Parse a complete AI response into structured content - None if unusable"""
+    parser = ContentStreamParser(topic)
+    parser.feed(text)
+    result = parser.result()
+    if not result:
+        print(f"[PARSE] Incomplete response for: {topic}")
+    return result
 
 
 def generate_smart_fallback(topic: str) -> dict:
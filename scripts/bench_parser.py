@@ -0,0 +1,169 @@
+"""Benchmark the incremental response parser against the legacy regex parser
+
+Usage:
+    python scripts/bench_parser.py                 # responses built from pre-built quests
+    python scripts/bench_parser.py recordings/     # recorded responses (*.txt / *.json)
+
+For every response it checks both parsers agree (or, for the samples in
+EXPECTED, that the incremental parser gives the expected outcome), then
+reports full-parse time and - for the incremental parser - how far into the stream the story
+became available when fed in small chunks.
+"""
+import os
+import re
+import sys
+import json
+import time
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from modules.stream_parser import ContentStreamParser, build_story, build_quiz, build_master, build_detective
+from modules.prebuilt_quests import quest_packs
+
+CHUNK_SIZE = 16  # Roughly a few tokens per streamed delta
+REPEAT = 200
+
+# Samples where the parsers are meant to differ: True = must parse, False = must be rejected
+EXPECTED = {
+    "story-raw-newlines": True,     # Legacy json.loads rejected control characters in strings
+    "story-broken": False,          # Undecodable story - no placeholder story, fall back to the next model
+    "story-missing": False,         # Legacy filled in a placeholder story
+}
+
+
+def legacy_parse_ai_response(text: str, topic: str) -> dict | None:
+    """parse_ai_response as it was before the incremental parser"""
+    try:
+        text = text.strip()
+        if "```" in text:
+            text = re.sub(r'```json?\s*', '', text)
+            text = re.sub(r'```', '', text)
+        start_idx = text.find('{')
+        end_idx = text.rfind('}')
+        if start_idx != -1 and end_idx != -1:
+            text = text[start_idx:end_idx+1]
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            text = re.sub(r',\s*}', '}', text)
+            text = re.sub(r',\s*]', ']', text)
+            data = json.loads(text)
+        quiz = build_quiz(data.get("quiz", {}), topic)
+        master = build_master(data.get("master", {}), topic)
+        detective = build_detective(data.get("detective", {}), topic)
+        if not (quiz and master and detective):
+            return None
+        return {"story": build_story(data.get("story", {}), topic), "quiz": quiz, "master": master, "detective": detective}
+    except Exception:
+        return None
+
+
+def incremental_parse(text: str, topic: str, chunk_size: int = 0) -> tuple[dict | None, int | None]:
+    """Parse with ContentStreamParser; returns (result, offset where story arrived)"""
+    parser = ContentStreamParser(topic)
+    story_at = None
+    step = chunk_size or len(text) or 1
+    for i in range(0, len(text), step):
+        for kind, _ in parser.feed(text[i:i + step]):
+            if kind == "story" and story_at is None:
+                story_at = i + step
+    return parser.result(), story_at
+
+
+def sample_responses() -> list[tuple[str, str]]:
+    """Unified-format responses rebuilt from the pre-built quests, in the shapes models send"""
+    responses = []
+    for quest_id, levels in quest_packs.active().featured.items():
+        for level, quest in levels.items():
+            detective = quest["detective"]
+            data = {
+                "story": quest["story"].model_dump(include={"title", "content", "key_facts"}),
+                "quiz": {"questions": [q.model_dump() for q in quest["quiz"].questions]},
+                "master": {"questions": [q.model_dump(include={"question", "options", "correct_answer", "explanation"})
+                                         for q in quest["master"].questions]},
+                "detective": {
+                    "case_title": detective.case_title,
+                    "scenario": detective.scenario,
+                    "clues": [{"id": c.id, "description": c.description} for c in detective.clues],
+                    "question": detective.question,
+                    "options": ["A", "B", "C", "D"],
+                    "correct_answer": detective.correct_answer,
+                    "explanation": detective.explanation,
+                },
+            }
+            plain = json.dumps(data, indent=2, ensure_ascii=False)
+            responses.append((f"{quest_id}-{level}-plain", plain))
+            responses.append((f"{quest_id}-{level}-fenced", f"Here is your quest!\n```json\n{plain}\n```\nHave fun!"))
+            responses.append((f"{quest_id}-{level}-trailing-commas", re.sub(r'(["\d\]}])(\n\s*[}\]])', r'\1,\2', plain)))
+
+    # Broken stories, on the last quest level's response
+    content = json.dumps(data["story"]["content"], ensure_ascii=False)[1:-1]
+    responses.append(("story-raw-newlines", plain.replace(content, content.replace(". ", ".\n"), 1)))
+    responses.append(("story-broken", plain.replace(content, 'He said "hi". ' + content, 1)))
+    responses.append(("story-missing", json.dumps({k: v for k, v in data.items() if k != "story"}, indent=2)))
+    return responses
+
+
+def load_responses(directory: Path) -> list[tuple[str, str]]:
+    responses = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix == ".txt":
+            responses.append((path.stem, path.read_text()))
+        elif path.suffix == ".json":
+            # Recorded chat completion (see scripts/stub_openrouter.py --record)
+            record = json.loads(path.read_text())
+            text = record.get("content") or record["response"]["choices"][0]["message"]["content"]
+            responses.append((path.stem, text))
+    return responses
+
+
+def timeit(fn, *args) -> float:
+    """Median microseconds per call"""
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    responses = load_responses(Path(sys.argv[1])) if len(sys.argv) > 1 else sample_responses()
+    print(f"{'response':<32}{'bytes':>7}{'legacy us':>11}{'incr us':>10}{'chunked us':>12}{'story at':>10}  agree")
+
+    totals = {"legacy": [], "incremental": [], "chunked": []}
+    disagreements = 0
+    for name, text in responses:
+        legacy = legacy_parse_ai_response(text, "bench")
+        result, _ = incremental_parse(text, "bench")
+        _, story_at = incremental_parse(text, "bench", CHUNK_SIZE)
+
+        if name in EXPECTED:
+            agree = (result is not None) == EXPECTED[name]
+        else:
+            agree = (legacy is None) == (result is None) and (
+                legacy is None or all(legacy[k] == result[k] for k in ("story", "quiz", "master", "detective"))
+            )
+        disagreements += not agree
+
+        legacy_us = timeit(legacy_parse_ai_response, text, "bench")
+        incr_us = timeit(incremental_parse, text, "bench")
+        chunked_us = timeit(incremental_parse, text, "bench", CHUNK_SIZE)
+        totals["legacy"].append(legacy_us)
+        totals["incremental"].append(incr_us)
+        totals["chunked"].append(chunked_us)
+
+        story_pct = f"{story_at / len(text):.0%}" if story_at else "-"
+        print(f"{name:<32}{len(text):>7}{legacy_us:>11.0f}{incr_us:>10.0f}{chunked_us:>12.0f}{story_pct:>10}  {'yes' if agree else 'NO'}")
+
+    print()
+    for label, values in totals.items():
+        print(f"{label:<12} median {statistics.median(values):8.0f} us   p90 {statistics.quantiles(values, n=10)[-1]:8.0f} us")
+    print(f"\n{len(responses)} responses, {disagreements} disagreements")
+
+
+if __name__ == "__main__":
+    main()
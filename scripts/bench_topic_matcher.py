@@ -0,0 +1,110 @@
+"""Topic matcher benchmark - alias trie vs the old keyword chain as aliases grow
+
+Registers synthetic quests with --aliases aliases in total (default 10k)
+on top of the real ones, then times is_featured_quest-style matching of
+hit and miss topics with both the trie (modules.prebuilt_quests) and a
+linear keyword chain like the one it replaced. The trie's cost should
+stay flat; the chain's grows with the alias count. Also checks that both
+agree on every sampled topic.
+
+Usage:
+    python scripts/bench_topic_matcher.py
+    python scripts/bench_topic_matcher.py --aliases 50000 --topics 2000
+"""
+import re
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.prebuilt_quests import quest_packs, LEVEL_PATTERN, TopicMatcher
+
+WORDS = ["quantum", "ancient", "ocean", "rome", "jazz", "volcano", "robot", "chess", "poetry", "cell",
+         "economy", "forest", "galaxy", "music", "energy", "bridge", "desert", "language", "storm", "coral"]
+ALIASES_PER_QUEST = 5
+
+
+def synthetic_aliases(total: int, rng: random.Random) -> dict:
+    """quest_id -> aliases of 1-3 words, unique across quests"""
+    pack = quest_packs.active()
+    aliases = {quest_id: names + [pack.info[quest_id]["title"].lower()] for quest_id, names in pack.aliases.items()}
+    seen = {alias for names in aliases.values() for alias in names}
+    quest = 0
+    while len(seen) < total:
+        names = []
+        while len(names) < ALIASES_PER_QUEST:
+            alias = " ".join(rng.choice(WORDS) + str(rng.randrange(1000)) for _ in range(rng.randint(1, 3)))
+            if alias not in seen:
+                seen.add(alias)
+                names.append(alias)
+        aliases[f"synthetic_{quest}"] = names
+        quest += 1
+    return aliases
+
+
+def legacy_match(aliases: dict, topic: str) -> str | None:
+    """The replaced approach: uncompiled level regexes, then every alias in turn"""
+    topic_lower = topic.lower().strip()
+    base_topic = re.sub(r"\(?(?:level|lvl)\s+(\d+)\)?", "", topic_lower).strip(" -()")
+    base_topic = " ".join(base_topic.split())
+    best = None
+    for quest_id, names in aliases.items():
+        for alias in names:
+            if (base_topic == alias or base_topic.startswith(alias + " ")) and (best is None or len(alias) > len(best[1])):
+                best = (quest_id, alias)
+    return best[0] if best else None
+
+
+def trie_match(matcher: TopicMatcher, topic: str) -> str | None:
+    topic_lower = topic.lower().strip()
+    if LEVEL_PATTERN.search(topic_lower):
+        topic_lower = LEVEL_PATTERN.sub("", topic_lower)
+    return matcher.match(topic_lower.strip(" -()"))
+
+
+def timed(fn, topics) -> float:
+    """Mean microseconds per call"""
+    started = time.perf_counter()
+    for topic in topics:
+        fn(topic)
+    return (time.perf_counter() - started) / len(topics) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--aliases", type=int, default=10000)
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'aliases':>10}{'build ms':>10}{'trie us':>10}{'chain us':>10}")
+    for total in sorted({n for n in (100, 1000, args.aliases) if n <= args.aliases}):
+        aliases = synthetic_aliases(total, rng)
+        flat = [alias for names in aliases.values() for alias in names]
+        topics = []
+        for _ in range(args.topics):
+            kind = rng.random()
+            if kind < 0.5:
+                topic = rng.choice(flat) + rng.choice(["", " basics", " for kids"])
+            else:
+                topic = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+            topics.append(topic + rng.choice(["", " (Level 2)", " (Level 3 - Advanced)"]))
+
+        started = time.perf_counter()
+        matcher = TopicMatcher(aliases)
+        build = (time.perf_counter() - started) * 1000
+        chain_topics = topics[:max(50, args.topics * 100 // total)]  # The chain is slow at 10k
+
+        disagreements = sum(trie_match(matcher, topic) != legacy_match(aliases, topic) for topic in chain_topics)
+        trie = timed(lambda topic: trie_match(matcher, topic), topics)
+        chain = timed(lambda topic: legacy_match(aliases, topic), chain_topics)
+        print(f"{matcher.aliases:>10}{build:>10.1f}{trie:>10.2f}{chain:>10.1f}"
+              + (f"   {disagreements} disagreements" if disagreements else ""))
+
+
+if __name__ == "__main__":
+    main()
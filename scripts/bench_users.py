@@ -0,0 +1,69 @@
+"""Per-user progress benchmark - lookup and update cost as the user table grows
+
+Fills a scratch database with users in steps up to --users (default 100k)
+and, at each size, times stats reads (uncached) and progress events
+against random users. With the indexed user_key both should stay flat.
+
+Usage:
+    python scripts/bench_users.py
+    python scripts/bench_users.py --users 200000 --samples 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+# Point the engine at a scratch database before anything imports it
+scratch = tempfile.TemporaryDirectory()
+os.environ["QUESTRA_DB_FILE"] = str(Path(scratch.name) / "bench.db")
+os.environ["STATS_VERSION_FILE"] = str(Path(scratch.name) / "stats.version")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import insert
+
+from gamification.database import engine
+from gamification.models_db import User
+from gamification.engine import load_stats, apply_progress_event
+
+
+def fill(start: int, stop: int, batch: int = 10000) -> None:
+    for first in range(start, stop, batch):
+        rows = [{"user_key": f"user-{i:08d}", "username": "Player", "xp": 0, "level": 1,
+                 "streak_days": 0, "achievements": [], "stories_completed": 0, "quizzes_passed": 0,
+                 "masters_completed": 0, "cases_solved": 0}
+                for i in range(first, min(first + batch, stop))]
+        with engine.begin() as conn:
+            conn.execute(insert(User), rows)
+
+
+def timed(fn, keys) -> float:
+    """Mean microseconds per call"""
+    started = time.perf_counter()
+    for key in keys:
+        fn(key)
+    return (time.perf_counter() - started) / len(keys) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=1000)
+    args = parser.parse_args()
+
+    sizes = [n for n in (1000, 10000, 100000, 1000000) if n < args.users] + [args.users]
+    print(f"{'users':>10}{'read us':>12}{'event us':>12}")
+    filled = 0
+    for size in sizes:
+        fill(filled, size)
+        filled = size
+        keys = [f"user-{random.randrange(size):08d}" for _ in range(args.samples)]
+        read = timed(load_stats, keys)
+        write = timed(lambda key: apply_progress_event(xp=10, stats=["quizzes"], user_key=key), keys)
+        print(f"{size:>10}{read:>12.1f}{write:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Build (and optionally activate) a quest pack in modules/quest_data/packs/<version>/
+
+Writes the byte-range index for the pack's quests.jsonl, then loads the pack
+exactly as the app does - manifest, every level parsed into the phase
+models, topic aliases - and fails without touching ACTIVE if anything is
+off. With --activate, ACTIVE is then replaced atomically; running workers
+switch new sessions to the pack within QUEST_PACK_CHECK_INTERVAL seconds.
+
+To publish new content, copy the current pack to a new version directory,
+edit it there and build that - never edit a pack sessions may be using.
+
+Usage:
+    python scripts/build_quest_pack.py 2
+    python scripts/build_quest_pack.py 2 --activate
+"""
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from modules.prebuilt_quests import (QUEST_PACKS_DIR, ACTIVE_PACK_FILE, QUEST_DATA_NAME, QUEST_INDEX_NAME,
+                                     QuestPack, build_index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("version")
+    parser.add_argument("--activate", action="store_true", help="point ACTIVE at the pack once it validates")
+    args = parser.parse_args()
+
+    directory = QUEST_PACKS_DIR / args.version
+    data = (directory / QUEST_DATA_NAME).read_bytes()
+    (directory / QUEST_INDEX_NAME).write_text(json.dumps(build_index(data)) + "\n", encoding="utf-8")
+    pack = QuestPack(args.version, directory)
+    print(f"[QUESTS] Pack {pack.version}: {len(pack.info)} quests, {pack.levels} levels, "
+          f"{pack.matcher.aliases} aliases ({len(data)} bytes) -> {directory}")
+
+    if args.activate:
+        staged = ACTIVE_PACK_FILE.with_name(ACTIVE_PACK_FILE.name + ".tmp")
+        staged.write_text(pack.version + "\n", encoding="utf-8")
+        os.replace(staged, ACTIVE_PACK_FILE)
+        print(f"[QUESTS] Activated pack {pack.version} -> {ACTIVE_PACK_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""End-to-end load test - drives the story -> quiz -> master -> detective flow
+
+Each virtual user is its own visitor (own client and questra_user cookie)
+and does what static/js/app.js does: start a session (JSON or
+SSE stream), complete the story, submit the quiz, submit master practice,
+solve the case, refreshing /api/stats after every phase. Reports
+throughput and latency percentiles per step.
+
+Run against the local OpenRouter stub so no real quota is spent:
+    python scripts/stub_openrouter.py --port 9000 --latency 2 --jitter 1
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/v1 OPENROUTER_API_KEY=stub \\
+        uvicorn main:app --port 8000            # or: gunicorn -k uvicorn.workers.UvicornWorker -w 4 main:app
+    python scripts/load_test.py --users 50 --duration 60
+    python scripts/load_test.py --users 50 --sessions 500 --stream --distinct-topics 20
+
+By default every session gets a fresh topic, so each one is a real
+generation; --distinct-topics N reuses N topics to exercise the content
+cache and request coalescing.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+
+import httpx
+
+STEPS = ("start", "story", "quiz", "master", "detective", "stats", "flow")
+
+
+class Recorder:
+    """Latencies and failures per step"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.sources = defaultdict(int)
+        self.first_phase = []  # Time to first streamed phase (stream mode)
+
+    def ok(self, step: str, seconds: float):
+        self.latencies[step].append(seconds)
+
+    def fail(self, step: str, reason: str):
+        self.failures[step] += 1
+        self.errors[f"{step}: {reason}"] += 1
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def timed(recorder: Recorder, step: str, request):
+    """Await one request, record its latency - None on failure"""
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError as e:
+        recorder.fail(step, type(e).__name__)
+        return None
+    if response.status_code != 200:
+        recorder.fail(step, f"HTTP {response.status_code}")
+        return None
+    recorder.ok(step, time.perf_counter() - started)
+    return response.json()
+
+
+async def start_stream(client: httpx.AsyncClient, recorder: Recorder, body: dict) -> dict | None:
+    """POST /api/session/start/stream and read events until done/error"""
+    started = time.perf_counter()
+    phases = {}
+    event = None
+    try:
+        async with client.stream("POST", "/api/session/start/stream", json=body) as response:
+            if response.status_code != 200:
+                recorder.fail("start", f"HTTP {response.status_code}")
+                return None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    data = json.loads(line[6:])
+                    if event in ("story", "quiz", "master", "detective"):
+                        if not phases:
+                            recorder.first_phase.append(time.perf_counter() - started)
+                        phases[event] = data
+                    elif event == "error":
+                        recorder.fail("start", data.get("message", "error")[:60])
+                        return None
+                    elif event == "done":
+                        recorder.ok("start", time.perf_counter() - started)
+                        return {**data, **phases}
+    except httpx.HTTPError as e:
+        recorder.fail("start", type(e).__name__)
+        return None
+    recorder.fail("start", "stream ended early")
+    return None
+
+
+async def run_flow(client: httpx.AsyncClient, recorder: Recorder, topic: str, stream: bool) -> None:
+    """One user session, start to solved case"""
+    flow_started = time.perf_counter()
+    body = {"topic": topic}
+
+    if stream:
+        session = await start_stream(client, recorder, body)
+    else:
+        session = await timed(recorder, "start", client.post("/api/session/start", json=body))
+    if not session:
+        return
+    recorder.sources[session.get("source", "unknown")] += 1
+    session_id = session["session_id"]
+    await timed(recorder, "stats", client.get("/api/stats"))
+
+    story = await timed(recorder, "story", client.post(f"/api/session/{session_id}/complete-story"))
+    if not story:
+        return
+    await timed(recorder, "stats", client.get("/api/stats"))
+
+    answers = [random.randrange(len(q["options"])) for q in story["quiz"]["questions"]]
+    quiz = await timed(recorder, "quiz", client.post(f"/api/session/{session_id}/submit-quiz",
+                                                     json={"answers": answers}))
+    if not quiz:
+        return
+    await timed(recorder, "stats", client.get("/api/stats"))
+
+    answers = [random.choice(q["options"]) for q in quiz["master"]["questions"]]
+    master = await timed(recorder, "master", client.post(f"/api/session/{session_id}/submit-master",
+                                                         json={"answers": answers}))
+    if not master:
+        return
+    await timed(recorder, "stats", client.get("/api/stats"))
+
+    case = await timed(recorder, "detective", client.post(f"/api/session/{session_id}/solve-case",
+                                                          json={"answer": random.choice("ABCD")}))
+    if not case:
+        return
+    await timed(recorder, "stats", client.get("/api/stats"))
+    recorder.ok("flow", time.perf_counter() - flow_started)
+
+
+def pick_topic(args, n: int) -> str:
+    if args.distinct_topics:
+        return f"{args.topic_prefix} {random.randrange(args.distinct_topics)}"
+    return f"{args.topic_prefix} {n}-{random.randrange(1 << 30)}"
+
+
+async def main_async(args) -> Recorder:
+    recorder = Recorder()
+    # A virtual user's requests are sequential - one keep-alive connection each
+    limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+    timeout = httpx.Timeout(args.timeout)
+    counter = iter(range(sys.maxsize))
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def more() -> bool:
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        return True
+
+    async def user():
+        # Own client per user: a shared one would share the cookie jar, making every user the same visitor
+        async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+            while more():
+                n = next(counter)
+                if args.sessions and n >= args.sessions:
+                    return
+                await run_flow(client, recorder, pick_topic(args, n), args.stream)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(args.users)))
+    recorder.elapsed = time.perf_counter() - started
+    return recorder
+
+
+def report(recorder: Recorder, args) -> None:
+    elapsed = recorder.elapsed
+    flows = len(recorder.latencies["flow"])
+    mode = "stream" if args.stream else "json"
+    print(f"\n{args.users} users, {mode} start, {elapsed:.1f}s")
+    print(f"Completed flows: {flows} ({flows / elapsed:.2f}/s)")
+    total = sum(len(v) for v in recorder.latencies.values()) - flows
+    print(f"Requests: {total} ok ({total / elapsed:.1f}/s), {sum(recorder.failures.values())} failed")
+    if recorder.sources:
+        print("Sources: " + ", ".join(f"{k}={v}" for k, v in sorted(recorder.sources.items())))
+
+    print(f"\n{'step':<10}{'ok':>7}{'fail':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = [(step, recorder.latencies[step]) for step in STEPS]
+    if recorder.first_phase:
+        rows.insert(1, ("1st phase", recorder.first_phase))
+    for step, values in rows:
+        if not values and not recorder.failures[step]:
+            continue
+        cells = [percentile(values, p) * 1000 for p in (50, 90, 99, 100)]
+        print(f"{step:<10}{len(values):>7}{recorder.failures[step]:>6}" + "".join(f"{c:>10.1f}" for c in cells))
+
+    if recorder.errors:
+        print("\nErrors:")
+        for reason, count in sorted(recorder.errors.items(), key=lambda kv: -kv[1])[:10]:
+            print(f"  {count:>5}  {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=0, help="Stop after this many sessions")
+    parser.add_argument("--duration", type=float, default=0, help="Stop starting sessions after N seconds")
+    parser.add_argument("--stream", action="store_true", help="Start sessions over SSE, like the browser")
+    parser.add_argument("--distinct-topics", type=int, default=0, help="Reuse this many topics (0 = all unique)")
+    parser.add_argument("--topic-prefix", default="load test topic")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if not args.sessions and not args.duration:
+        args.sessions = args.users * 5
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report(asyncio.run(main_async(args)), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Local OpenRouter stand-in - an OpenAI-compatible chat completions stub
+
+Serves unified-format learning content (built from the pre-built quests)
+with configurable latency, errors, hangs, malformed JSON and streaming, so
+/api/session/start can be load-tested without spending real quota.
+
+Usage:
+    python scripts/stub_openrouter.py --port 9000 --latency 2 --jitter 1 \\
+        --error-rate 0.05 --timeout-rate 0.02 --malformed-rate 0.05
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/v1 uvicorn main:app
+
+Per-model behaviour (to exercise hedging and the model router):
+    --model-latency google/gemini-2.0-flash-exp:free=20 --model-error-rate google/gemma-3-27b-it:free=1
+
+Record real responses, then replay them offline:
+    python scripts/stub_openrouter.py --record recordings/   # proxies to OpenRouter
+    python scripts/stub_openrouter.py --replay recordings/
+Recordings are one JSON file per response and can be fed to
+scripts/bench_parser.py as well.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENROUTER_API_KEY", "stub")
+
+from modules.prebuilt_quests import quest_packs
+
+UPSTREAM_URL = "https://openrouter.ai/api/v1"
+
+app = FastAPI(title="OpenRouter stub")
+config = argparse.Namespace()
+replay_pool = []
+stats = {"requests": 0, "streamed": 0, "errors": 0, "timeouts": 0, "malformed": 0, "recorded": 0, "replayed": 0}
+
+
+# ==================== Content ====================
+
+def synthetic_content(prompt: str) -> str:
+    """A unified-format response, built from a random pre-built quest level"""
+    topic = prompt.split("about:", 1)[-1].split("\n", 1)[0].strip() or "the topic"
+    levels = random.choice(list(quest_packs.active().featured.values()))
+    quest = random.choice(list(levels.values()))
+    detective = quest["detective"]
+    data = {
+        "story": {
+            "title": f"{quest['story'].title} ({topic})",
+            "content": quest["story"].content,
+            "key_facts": quest["story"].key_facts,
+        },
+        "quiz": {"questions": [q.model_dump() for q in quest["quiz"].questions]},
+        "master": {"questions": [q.model_dump(include={"question", "options", "correct_answer", "explanation"})
+                                 for q in quest["master"].questions]},
+        "detective": {
+            "case_title": detective.case_title,
+            "scenario": detective.scenario,
+            "clues": [{"id": c.id, "description": c.description} for c in detective.clues],
+            "question": detective.question,
+            "correct_answer": detective.correct_answer,
+            "explanation": detective.explanation,
+        },
+    }
+    return "```json\n" + json.dumps(data, indent=2) + "\n```"
+
+
+def malform(text: str) -> str:
+    """Break a response the way models do: truncation, prose only, or a missing brace"""
+    kind = random.choice(["truncate", "prose", "brace"])
+    if kind == "truncate":
+        return text[:len(text) // 2]
+    if kind == "prose":
+        return "I'm sorry, I can't produce JSON for that topic right now."
+    return text.replace("}", "", 1)
+
+
+def per_model(values: list, model: str, default: float) -> float:
+    """Look up a MODEL=VALUE override"""
+    for item in values or []:
+        name, _, value = item.rpartition("=")
+        if name == model:
+            return float(value)
+    return default
+
+
+# ==================== Responses ====================
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 400, "completion_tokens": len(content) // 4, "total_tokens": 400 + len(content) // 4},
+    }
+
+
+async def stream_chunks(model: str, content: str):
+    """Server-Sent Events in the OpenAI chunk format"""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    size = config.chunk_chars
+    for i in range(0, len(content), size):
+        chunk = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        if config.chunk_delay:
+            await asyncio.sleep(config.chunk_delay)
+    done = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    yield f"data: {json.dumps(done)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+async def proxy_and_record(request: Request, body: dict) -> str:
+    """Ask the real upstream (non-streaming) and save the exchange"""
+    headers = {"Authorization": request.headers.get("authorization", "")}
+    upstream_body = {**body, "stream": False}
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        response = await client.post(f"{config.upstream}/chat/completions", json=upstream_body, headers=headers)
+    response.raise_for_status()
+    data = response.json()
+    content = data["choices"][0]["message"]["content"]
+
+    prompt = body["messages"][-1]["content"]
+    digest = hashlib.sha1(f"{body.get('model')}\n{prompt}\n{time.time()}".encode()).hexdigest()[:12]
+    record = {"model": body.get("model"), "prompt": prompt, "content": content, "response": data}
+    (Path(config.record) / f"{digest}.json").write_text(json.dumps(record, indent=2))
+    stats["recorded"] += 1
+    return content
+
+
+@app.post("/v1/chat/completions")
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    prompt = body["messages"][-1]["content"]
+    stats["requests"] += 1
+
+    latency = per_model(config.model_latency, model, config.latency)
+    await asyncio.sleep(max(0.0, random.gauss(latency, config.jitter) if config.jitter else latency))
+
+    if random.random() < per_model(config.model_error_rate, model, config.error_rate):
+        stats["errors"] += 1
+        status = random.choice([429, 500, 502])
+        return JSONResponse({"error": {"message": "Stub injected error", "code": status}}, status_code=status)
+
+    if random.random() < per_model(config.model_timeout_rate, model, config.timeout_rate):
+        stats["timeouts"] += 1
+        await asyncio.sleep(config.hang)  # Longer than the app's 60s client timeout by default
+
+    if config.record:
+        content = await proxy_and_record(request, body)
+    elif replay_pool:
+        content = random.choice(replay_pool)
+        stats["replayed"] += 1
+    else:
+        content = synthetic_content(prompt)
+
+    if random.random() < config.malformed_rate:
+        stats["malformed"] += 1
+        content = malform(content)
+
+    if body.get("stream"):
+        stats["streamed"] += 1
+        return StreamingResponse(stream_chunks(model, content), media_type="text/event-stream")
+    return completion(model, content)
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def load_replay(directory: str) -> list:
+    contents = []
+    for path in sorted(Path(directory).glob("*.json")):
+        record = json.loads(path.read_text())
+        contents.append(record.get("content") or record["response"]["choices"][0]["message"]["content"])
+    return contents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=1.0, help="Mean seconds before answering")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Std-dev of the latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction answered with 429/500/502")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction that hang for --hang seconds")
+    parser.add_argument("--hang", type=float, default=90.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction with broken JSON")
+    parser.add_argument("--chunk-chars", type=int, default=24, help="Characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Seconds between streamed chunks")
+    parser.add_argument("--model-latency", action="append", metavar="MODEL=SECONDS")
+    parser.add_argument("--model-error-rate", action="append", metavar="MODEL=RATE")
+    parser.add_argument("--model-timeout-rate", action="append", metavar="MODEL=RATE")
+    parser.add_argument("--record", metavar="DIR", help="Proxy to --upstream and save every response")
+    parser.add_argument("--upstream", default=UPSTREAM_URL)
+    parser.add_argument("--replay", metavar="DIR", help="Serve previously recorded responses")
+    parser.add_argument("--seed", type=int)
+    parser.parse_args(namespace=config)
+
+    if config.seed is not None:
+        random.seed(config.seed)
+    if config.record:
+        Path(config.record).mkdir(parents=True, exist_ok=True)
+    if config.replay:
+        replay_pool.extend(load_replay(config.replay))
+        print(f"[STUB] Replaying {len(replay_pool)} recorded responses")
+
+    uvicorn.run(app, host=config.host, port=config.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
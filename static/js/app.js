@@ -168,52 +168,91 @@ async function startLearning() {
 
     try {
         const userApiKey = getUserApiKey();
-        const response = await fetch('/api/session/start', {
+        const response = await fetch('/api/session/start/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ topic, api_key: userApiKey || undefined })
         });
 
-        const data = await response.json();
-
-        // Check for error response
-        if (data.error || !response.ok) {
+        if (!response.ok || !response.body) {
             hideLoading();
-            alert(data.message || 'Unable to generate content. Please try a Featured Quest instead!');
+            alert('Unable to generate content. Please try a Featured Quest instead!');
             return;
         }
 
-        currentSession = {
-            id: data.session_id,
-            topic: data.topic,
-            aiGenerated: data.ai_generated,
-            source: data.source
-        };
-
-        // Show session UI
-        document.getElementById('topic-section').style.display = 'none';
-        document.getElementById('session-container').style.display = 'flex';
-        document.getElementById('sidebar-topic').textContent = data.topic;
-
-        // Display story
-        document.getElementById('story-title').textContent = data.story.title;
-        document.getElementById('story-content').innerHTML = formatStoryContent(data.story.content);
-
-        // Activate story step and update level display
-        activateStep('story');
-        updateSidebarLevels(currentLevel);
-
-        hideLoading();
+        currentSession = null;
+        const continueBtn = document.getElementById('complete-story-btn');
+
+        // Story shows up as soon as it is generated; the rest streams in behind it
+        await readEventStream(response, (event, data) => {
+            if (event === 'story') {
+                document.getElementById('topic-section').style.display = 'none';
+                document.getElementById('session-container').style.display = 'flex';
+                document.getElementById('sidebar-topic').textContent = topic;
+
+                document.getElementById('story-title').textContent = data.title;
+                document.getElementById('story-content').innerHTML = formatStoryContent(data.content);
+
+                activateStep('story');
+                updateSidebarLevels(currentLevel);
+                continueBtn.disabled = true;
+                hideLoading();
+            } else if (event === 'done') {
+                currentSession = {
+                    id: data.session_id,
+                    topic: data.topic,
+                    aiGenerated: data.ai_generated,
+                    source: data.source
+                };
+                continueBtn.disabled = false;
+                console.log(`✅ Content loaded (source: ${data.source})`);
+            } else if (event === 'error') {
+                throw new Error(data.message);
+            }
+        });
 
-        // Log content source
-        console.log(`✅ Content loaded (source: ${data.source})`);
+        if (!currentSession) {
+            throw new Error('Content stream ended early');
+        }
     } catch (error) {
         hideLoading();
-        alert('Error starting session. Please try a Featured Quest!');
+        // The story may already be on screen without a session behind it - go back to topic entry
+        currentSession = null;
+        document.getElementById('session-container').style.display = 'none';
+        document.getElementById('topic-section').style.display = 'block';
+        document.getElementById('complete-story-btn').disabled = false;
+        alert(error.message || 'Error starting session. Please try a Featured Quest!');
         console.error(error);
     }
 }
 
+async function readEventStream(response, onEvent) {
+    // Minimal Server-Sent Events reader for fetch() responses (EventSource can't POST)
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            onEvent(event, data ? JSON.parse(data) : {});
+        }
+    }
+}
+
 async function completeStory() {
     if (!currentSession) return;
 
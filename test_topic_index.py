@@ -0,0 +1,127 @@
+"""Topic Index - hand-labelled custom topics against the featured quests and cached AI topics
+
+Run with `python -m pytest test_topic_index.py` or `python test_topic_index.py`.
+Positives name the quest or cached topic that covers them; negatives (None)
+must never be routed to one. A missed positive only costs a generation, a wrong route
+serves the user the wrong lesson - so negatives are strict and positives
+have a minimum recall.
+"""
+import os
+import tempfile
+
+# Keep the cached AI topics of a real database out of it - the tests add their own
+os.environ.setdefault("QUESTRA_DB_FILE", os.path.join(tempfile.mkdtemp(), "questra.db"))
+
+from gamification.models import Story
+from modules.topic_index import TopicIndex, QUEST_DOC, CACHED_DOC
+
+LABELLED = [
+    # Covered by a featured quest
+    ("how do black holes form", "black_holes"),
+    ("what happens inside a black hole", "black_holes"),
+    ("event horizons and singularities", "black_holes"),
+    ("how do stars collapse into black holes", "black_holes"),
+    ("what is a neural network", "ai"),
+    ("how do neural nets learn", "ai"),
+    ("deep learning basics", "ai"),
+    ("chatgpt and large language models", "ai"),
+    ("how does machine learning work", "ai"),
+    ("python programming for beginners", "python"),
+    ("python lists and loops", "python"),
+    ("writing python functions", "python"),
+    ("t rex and velociraptors", "dinosaurs"),
+    ("why did the dinosaurs go extinct", "dinosaurs"),
+    ("jurassic period reptiles", "dinosaurs"),
+    ("how does heredity work", "dna"),
+    ("genes and chromosomes", "dna"),
+    ("what is a double helix", "dna"),
+    ("dna replication", "dna"),
+    # Not covered by any of them
+    ("world war 2", None),
+    ("probability", None),
+    ("marine biology", None),
+    ("mlb baseball", None),
+    ("ball python care", None),
+    ("monty python sketches", None),
+    ("black friday deals", None),
+    ("zorbular physics", None),
+    ("rust programming", None),
+    ("javascript promises", None),
+    ("roman empire", None),
+    ("the french revolution", None),
+    ("climate change", None),
+    ("bird migration", None),
+    ("photosynthesis", None),
+    ("volcanoes", None),
+    ("linear algebra", None),
+    ("french cooking", None),
+    ("guitar chords", None),
+    ("stock market investing", None),
+]
+
+MIN_RECALL = 0.8
+
+# Cached AI topics: (topic, story title, key facts)
+CACHED = [
+    ("world war 2", "World War 2: A Global History", ["World War 2 lasted from 1939 to 1945",
+                                                      "The Allies fought the Axis powers"]),
+    ("java", "Java Programming Fundamentals", ["Java runs on the JVM", "Java is object-oriented"]),
+    ("organic chemistry", "The Chemistry of Carbon", ["Organic chemistry studies carbon compounds",
+                                                      "Hydrocarbons contain only carbon and hydrogen"]),
+    ("roman empire", "Rise and Fall of the Roman Empire", ["Augustus was the first Roman emperor",
+                                                           "The Western Roman Empire fell in 476"]),
+]
+
+LABELLED_CACHED = [
+    # Same subject as a cached topic
+    ("the history of world war 2", "world war 2"),
+    ("java programming", "java"),
+    ("organic chemistry basics", "organic chemistry"),
+    ("rise and fall of the roman empire", "roman empire"),
+    # Look alike, but a different lesson
+    ("world war 1", None),
+    ("javascript", None),
+    ("inorganic chemistry", None),
+    ("holy roman empire", None),
+]
+
+
+def routed(index: TopicIndex, topic: str, kind: str = QUEST_DOC) -> str | None:
+    match = index.match(topic)
+    return match[1] if match and match[0] == kind else None
+
+
+def test_topic_index():
+    index = TopicIndex()
+    wrong = []
+    found = 0
+    positives = [(topic, quest) for topic, quest in LABELLED if quest]
+    for topic, quest in LABELLED:
+        got = routed(index, topic)
+        if got is not None and got != quest:
+            wrong.append(f"{topic!r} -> {got} (expected {quest})")
+        elif quest and got == quest:
+            found += 1
+
+    assert not wrong, "Routed to the wrong quest: " + "; ".join(wrong)
+    recall = found / len(positives)
+    assert recall >= MIN_RECALL, f"Recall {recall:.2f} < {MIN_RECALL}"
+    print(f"✅ {len(LABELLED)} labelled topics: no wrong routes, recall {recall:.2f}")
+
+
+def test_cached_topics():
+    index = TopicIndex()
+    for topic, title, key_facts in CACHED:
+        story = Story(topic=topic, title=title, content="", key_facts=key_facts)
+        index.add_cached(topic, {"story": story})
+
+    wrong = [f"{topic!r} -> {got} (expected {expected})"
+             for topic, expected in LABELLED_CACHED
+             if (got := routed(index, topic, CACHED_DOC)) != expected]
+    assert not wrong, "Cached topics routed wrong: " + "; ".join(wrong)
+    print(f"✅ {len(LABELLED_CACHED)} labelled cached topics routed as expected")
+
+
+if __name__ == "__main__":
+    test_topic_index()
+    test_cached_topics()